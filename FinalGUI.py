@@ -610,11 +610,16 @@ class CameraConfigPage(BasePage):
         cmd = self.ffmpeg_cmd_entry_receiving.get() if not self.use_default.get() else self.ffmpeg_cmd_entry_receiving.get()
         cmd2 = self.ffmpeg_cmd_entry_receiving2.get() if not self.use_default.get() else self.ffmpeg_cmd_entry_receiving2.get()
 
-        config = {
-            "camera1": cmd,
-            "camera2": cmd2,
-            # Add more entries as needed
-        }
+        # Keep any tuning keys already in ai_config.json
+        config = {}
+        if os.path.exists("ai_config.json"):
+            try:
+                with open("ai_config.json", "r") as f:
+                    config = json.load(f)
+            except Exception as e:
+                Logger.log(f"[CONFIG] Could not read ai_config.json: {e}")
+        config["camera1"] = cmd
+        config["camera2"] = cmd2
 
         try:
             # Save to JSON
@@ -1,58 +1,91 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from assignment import gated_assignment
 
 debug = True
 testing = False
 dist = 25
 
 class DistTracker:
+    """Centroid tracker over [x, y, w, h] boxes with stable IDs.
+
+    Track state lives in NumPy arrays with slot reuse. Each update() matches the
+    detections to the live tracks with associate() (spatial grid plus a global
+    assignment on center distance), so cost stays low at hundreds of boxes per
+    frame. A track keeps its ID until it has gone max_age updates unmatched.
+    """
+
+    def __init__(self, gate=dist, max_age=5, capacity=64, box_format="xywh"):
+        self.gate = gate
+        self.max_age = max_age
+        self.box_format = box_format  # "xywh" (MotionDetection) or "xyxy" (YOLO)
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.boxes = np.zeros((capacity, 4))
+        self.missed = np.zeros(capacity, dtype=np.int64)
+        self.hits = np.zeros(capacity, dtype=np.int64)
+        self.next_id = 1
+        self.dtype = np.int64
+
+    def centers(self, boxes):
+        if self.box_format == "xyxy":
+            return (boxes[:, :2] + boxes[:, 2:]) / 2
+        return boxes[:, :2] + boxes[:, 2:] / 2
 
-    def __init__(self):
-        self.detection = []
-        self.objects = []
+    def _grow(self):
+        extra = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.full(extra, -1, dtype=np.int64)])
+        self.boxes = np.concatenate([self.boxes, np.zeros((extra, 4))])
+        self.missed = np.concatenate([self.missed, np.zeros(extra, dtype=np.int64)])
+        self.hits = np.concatenate([self.hits, np.zeros(extra, dtype=np.int64)])
 
     def update(self, detections):
-        if self.detection == []:
-            self.detection = detections
-        for coords in detections:
-            self.CheckObject(coords)
-        self.mergeConnectedObjects()
-    
-    def mergeConnectedObjects(self):
-        for object1 in self.objects:
-            for object2 in self.objects:
-                Same = False
-                if object1 != object2:
-                    Same = self.SameObjectDetection(object2.coordinates, object1)
-                if Same:
-                    self.objects.remove(object2)
-        count = 1
-        for object in self.objects:
-            object.ID = count
-            count+=1
-
-
-    def CheckObject(self, coordinates):
-        Found = False
-        totalObjects = 0
-        for known in self.objects:
-            if testing == True:
-                print(known.ID ,known.coordinates, coordinates)
-            totalObjects+=1
-            Found = Found | self.SameObjectDetection(coordinates,known)
-        if Found == False:
-            newobject = Objects(coordinates, totalObjects+1)
-            self.objects.append(newobject)
-            if testing == True:
-                print("New")
-                print(newobject.coordinates)
-            
-
-    def SameObjectDetection(self, new, old):
-        if (abs(new[0] - old.coordinates[0]) < dist and abs(new[1] - old.coordinates[1]) < dist):
-            if testing == True:
-                print(old.coordinates, new)
-            old.coordinates = new
-            return True
-        return False
+        """Match one frame of boxes to the tracks. Returns the track ID of each detection."""
+        detections = np.asarray(detections).reshape(-1, 4)
+        if len(detections):
+            self.dtype = detections.dtype
+        detections = detections.astype(np.float64)
+
+        live = np.flatnonzero(self.ids >= 0)
+        matches = associate(self.centers(self.boxes[live]), self.centers(detections), self.gate)
+        det_index, slots = matches[:, 0], live[matches[:, 1]]
+
+        self.missed[live] += 1
+        self.boxes[slots] = detections[det_index]
+        self.missed[slots] = 0
+        self.hits[slots] += 1
+
+        assigned = np.full(len(detections), -1, dtype=np.int64)
+        assigned[det_index] = self.ids[slots]
+
+        # Unmatched detections start new tracks in free slots
+        new = np.flatnonzero(assigned < 0)
+        free = np.flatnonzero(self.ids < 0)
+        while len(free) < len(new):
+            self._grow()
+            free = np.flatnonzero(self.ids < 0)
+        slots = free[:len(new)]
+        new_ids = np.arange(self.next_id, self.next_id + len(new))
+        self.next_id += len(new)
+        self.ids[slots] = new_ids
+        self.boxes[slots] = detections[new]
+        self.missed[slots] = 0
+        self.hits[slots] = 1
+        assigned[new] = new_ids
+
+        # Age out tracks that have gone unmatched too long
+        self.ids[(self.ids >= 0) & (self.missed > self.max_age)] = -1
+        return assigned
+
+    @property
+    def objects(self):
+        """Tracks matched in the latest update, as Objects with ID and coordinates."""
+        seen = np.flatnonzero((self.ids >= 0) & (self.missed == 0))
+        return [Objects(self.boxes[slot].astype(self.dtype).tolist(), int(self.ids[slot])) for slot in seen]
+
+    def __len__(self):
+        return int((self.ids >= 0).sum())
 
 class Objects:
 
@@ -63,7 +96,316 @@ class Objects:
     def update(self, coordinates):
         self.coordinates = coordinates
 
-if debug == True:
+
+class SpatialGrid:
+    """Uniform grid of image points; a query only visits the 3x3 cells around it.
+
+    With the cell size equal to the association gate, every point within the
+    gate of a query is guaranteed to be in one of those nine cells.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}  # {(cell_x, cell_y): [point index, ...]}
+
+    def build(self, points):
+        self.cells = {}
+        keys = np.floor(np.asarray(points, dtype=np.float64) / self.cell_size).astype(np.int64)
+        for n, (cx, cy) in enumerate(keys.tolist()):
+            self.cells.setdefault((cx, cy), []).append(n)
+        return self
+
+    def neighbors(self, point):
+        cx, cy = int(point[0] // self.cell_size), int(point[1] // self.cell_size)
+        found = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                found.extend(self.cells.get((cx + dx, cy + dy), ()))
+        return found
+
+    def pairs(self, queries):
+        """(query index, point index) arrays for every point in the cells around each query."""
+        rows, cols = [], []
+        for n, point in enumerate(np.asarray(queries, dtype=np.float64)):
+            found = self.neighbors(point)
+            rows.extend([n] * len(found))
+            cols.extend(found)
+        return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+
+def associate(track_points, points, gate, track_sizes=None, sizes=None, size_gate=None):
+    """Globally assign points to previous track points within the gate.
+
+    Candidate pairs come from a SpatialGrid, so only nearby tracks are compared.
+    Candidates are split into connected clusters and each cluster is solved as a
+    minimum total distance assignment, so one crowded area does not make the whole
+    frame expensive. Returns an (M, 2) array of (point index, track index) rows.
+    """
+    track_points = np.asarray(track_points, dtype=np.float64).reshape(-1, 2)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    matches = np.empty((0, 2), dtype=np.intp)
+    if len(track_points) == 0 or len(points) == 0:
+        return matches
+
+    rows, cols = SpatialGrid(gate).build(track_points).pairs(points)
+    distances = np.hypot(*(points[rows] - track_points[cols]).T)
+    keep = distances < gate
+    if size_gate is not None:
+        keep &= np.abs(np.asarray(sizes)[rows] - np.asarray(track_sizes)[cols]) < size_gate
+    rows, cols, distances = rows[keep], cols[keep], distances[keep]
+    if len(rows) == 0:
+        return matches
+
+    # Points and tracks are nodes, candidate pairs are edges
+    n = len(points)
+    graph = coo_matrix((np.ones(len(rows)), (rows, cols + n)), shape=(n + len(track_points),) * 2)
+    _, labels = connected_components(graph, directed=False)
+    edge_labels = labels[rows]
+    order = np.argsort(edge_labels, kind="stable")
+    splits = np.flatnonzero(np.diff(edge_labels[order])) + 1
+
+    found = []
+    for edges in np.split(order, splits):
+        cluster_rows, cluster_cols = np.unique(rows[edges]), np.unique(cols[edges])
+        cost = np.zeros((len(cluster_rows), len(cluster_cols)))
+        allowed = np.zeros(cost.shape, dtype=bool)
+        cell = np.searchsorted(cluster_rows, rows[edges]), np.searchsorted(cluster_cols, cols[edges])
+        cost[cell] = distances[edges]
+        allowed[cell] = True
+        r, c = gated_assignment(cost, allowed)
+        found.append(np.column_stack([cluster_rows[r], cluster_cols[c]]))
+    return np.concatenate(found) if found else matches
+
+
+class TrackStore:
+    """Fixed-size history ring per track, with slot reuse and time-based eviction.
+
+    Memory is allocated once for capacity tracks, so it stays flat no matter how
+    high the track IDs climb. A track is evicted once it has not been seen for
+    timeout seconds, or when a new track needs a slot and the store is full.
+    """
+
+    def __init__(self, capacity=64, history=10, timeout=1.0):
+        self.timeout = timeout
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.values = np.zeros((capacity, history))
+        self.count = np.zeros(capacity, dtype=np.int64)  # Samples held, at most history
+        self.head = np.zeros(capacity, dtype=np.int64)   # Next write position in the ring
+        self.last_seen = np.zeros(capacity)
+        self.slot_of = {}  # {track_id: slot}
+        self.evicted = 0
+
+    def _slot(self, track_id):
+        slot = self.slot_of.get(track_id)
+        if slot is not None:
+            return slot
+        free = np.flatnonzero(self.ids < 0)
+        if len(free):
+            slot = int(free[0])
+        else:
+            # Full: reuse the least recently seen track's slot
+            slot = int(self.last_seen.argmin())
+            self._drop(slot)
+        self.ids[slot] = track_id
+        self.count[slot] = 0
+        self.head[slot] = 0
+        self.slot_of[track_id] = slot
+        return slot
+
+    def _drop(self, slot):
+        del self.slot_of[int(self.ids[slot])]
+        self.ids[slot] = -1
+        self.evicted += 1
+
+    def push(self, track_id, value, now):
+        """Append value to the track's ring and mark it seen at now."""
+        slot = self._slot(track_id)
+        self.values[slot, self.head[slot]] = value
+        self.head[slot] = (self.head[slot] + 1) % self.values.shape[1]
+        self.count[slot] = min(self.count[slot] + 1, self.values.shape[1])
+        self.last_seen[slot] = now
+
+    def size(self, track_id):
+        slot = self.slot_of.get(track_id)
+        return 0 if slot is None else int(self.count[slot])
+
+    def history(self, track_id):
+        """The track's stored values (order within the ring is not preserved)."""
+        slot = self.slot_of.get(track_id)
+        if slot is None:
+            return self.values[:0, 0]
+        return self.values[slot, :self.count[slot]]
+
+    def median(self, track_id):
+        return float(np.median(self.history(track_id)))
+
+    def evict(self, now):
+        """Free the slots of tracks not seen for timeout seconds. Returns how many were evicted."""
+        stale = np.flatnonzero((self.ids >= 0) & (now - self.last_seen > self.timeout))
+        for slot in stale:
+            self._drop(slot)
+        return len(stale)
+
+    @property
+    def live(self):
+        return len(self.slot_of)
+
+    def report(self):
+        return f"[TRACKS] live={self.live}/{len(self.ids)} evicted={self.evicted}"
+
+
+class KalmanTracker:
+    """Constant-velocity Kalman filter over many tracks at once.
+
+    Each track's state is [x, y, vx, vy] in world feet, stored row-wise in NumPy
+    arrays so predict and update are batched matrix operations per frame.
+    Stereo depth error grows with range (one pixel of disparity is d^2 / (f * B)
+    feet), so each measurement's noise is computed from its depth. Measurements
+    further than the gate from a track's prediction are rejected, which replaces
+    the old fixed jump clamp; after max_rejections in a row the track restarts at
+    the new measurement, so a real jump gets through within a few frames.
+    """
+
+    def __init__(self, capacity=32, accel_std=2.0, focal_px=700, baseline_ft=1.5, disparity_std=1.0,
+                 min_depth_std=0.5, lateral_std=0.5, initial_speed_std=5.0, gate=11.8, max_rejections=3):
+        self.accel_var = accel_std ** 2
+        self.depth_per_pixel = disparity_std / (focal_px * baseline_ft)  # Times d^2
+        self.min_depth_std = min_depth_std
+        self.lateral_std = lateral_std
+        self.initial_speed_var = initial_speed_std ** 2
+        self.gate = gate  # Mahalanobis distance squared, ~99.7% for 2 degrees of freedom
+        self.max_rejections = max_rejections
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.x = np.zeros((capacity, 4))
+        self.P = np.zeros((capacity, 4, 4))
+        self.updated = np.zeros(capacity)  # Last accepted measurement time
+        self.stamp = np.zeros(capacity)    # Time the state was last predicted to
+        self.rejections = np.zeros(capacity, dtype=np.int64)  # Consecutive gated-out measurements
+
+    def measurement_noise(self, measurements):
+        """(n, 2, 2) measurement covariance for (n, 2) world points, growing with depth."""
+        depth = np.abs(measurements[:, 1])
+        depth_std = np.maximum(self.min_depth_std, depth ** 2 * self.depth_per_pixel)
+        # Lateral = bearing * depth, so depth error carries over in proportion to the bearing
+        bearing = np.divide(measurements[:, 0], depth, out=np.zeros_like(depth), where=depth > 0)
+        lateral_var = self.lateral_std ** 2 + (bearing * depth_std) ** 2
+        R = np.zeros((len(measurements), 2, 2))
+        R[:, 0, 0] = lateral_var
+        R[:, 1, 1] = depth_std ** 2
+        return R
+
+    def _start(self, slots, measurements, R, now):
+        """(Re)initialise tracks at their measurements with zero velocity."""
+        self.x[slots, :2] = measurements
+        self.x[slots, 2:] = 0.0
+        self.P[slots] = 0.0
+        self.P[slots, :2, :2] = R
+        self.P[slots, 2, 2] = self.P[slots, 3, 3] = self.initial_speed_var
+        self.updated[slots] = now
+        self.stamp[slots] = now
+        self.rejections[slots] = 0
+
+    def _slots(self, track_ids, measurements, R, now):
+        """Slot index for each ID, starting new tracks at their first measurement."""
+        slots = np.empty(len(track_ids), dtype=np.intp)
+        for n, tid in enumerate(track_ids):
+            found = np.flatnonzero(self.ids == tid)
+            if len(found):
+                slots[n] = found[0]
+                continue
+            free = np.flatnonzero(self.ids < 0)
+            if len(free) == 0:
+                self._grow()
+                free = np.flatnonzero(self.ids < 0)
+            slot = free[0]
+            self.ids[slot] = tid
+            self._start([slot], measurements[n:n + 1], R[n:n + 1], now)
+            slots[n] = slot
+        return slots
+
+    def _grow(self):
+        extra = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.full(extra, -1, dtype=np.int64)])
+        self.x = np.concatenate([self.x, np.zeros((extra, 4))])
+        self.P = np.concatenate([self.P, np.zeros((extra, 4, 4))])
+        self.updated = np.concatenate([self.updated, np.zeros(extra)])
+        self.stamp = np.concatenate([self.stamp, np.zeros(extra)])
+        self.rejections = np.concatenate([self.rejections, np.zeros(extra, dtype=np.int64)])
+
+    def predict(self, now):
+        """Advance every live track to time now."""
+        live = np.flatnonzero(self.ids >= 0)
+        if len(live) == 0:
+            return
+        dt = now - self.stamp[live]
+        F = np.tile(np.eye(4), (len(live), 1, 1))
+        F[:, 0, 2] = dt
+        F[:, 1, 3] = dt
+        # White-noise acceleration process noise
+        Q = np.zeros((len(live), 4, 4))
+        q11, q12, q22 = dt ** 3 / 3, dt ** 2 / 2, dt
+        for a, b in ((0, 2), (1, 3)):
+            Q[:, a, a] = q11
+            Q[:, a, b] = Q[:, b, a] = q12
+            Q[:, b, b] = q22
+        Q *= self.accel_var
+
+        self.x[live] = np.einsum("nij,nj->ni", F, self.x[live])
+        self.P[live] = F @ self.P[live] @ F.transpose(0, 2, 1) + Q
+        self.stamp[live] = now
+
+    def update(self, track_ids, measurements, now):
+        """Correct the tracks in track_ids with (n, 2) world measurements. Returns accepted mask."""
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, 2)
+        if len(measurements) == 0:
+            return np.zeros(0, dtype=bool)
+        R = self.measurement_noise(measurements)
+        slots = self._slots(track_ids, measurements, R, now)
+        x, P = self.x[slots], self.P[slots]
+
+        residual = measurements - x[:, :2]
+        S_inv = np.linalg.inv(P[:, :2, :2] + R)
+        K = P[:, :, :2] @ S_inv                                   # (n, 4, 2)
+        distance2 = np.einsum("ni,nij,nj->n", residual, S_inv, residual)
+        accepted = distance2 <= self.gate
+
+        x[accepted] += np.einsum("nij,nj->ni", K[accepted], residual[accepted])
+        P[accepted] -= K[accepted] @ P[accepted, :2, :]
+        self.x[slots], self.P[slots] = x, P
+        self.updated[slots[accepted]] = now
+        self.rejections[slots[accepted]] = 0
+        self.rejections[slots[~accepted]] += 1
+
+        # Consistently gated out: the person really moved, start over at the measurement
+        restart = ~accepted & (self.rejections[slots] >= self.max_rejections)
+        if np.any(restart):
+            self._start(slots[restart], measurements[restart], R[restart], now)
+        return accepted
+
+    def step(self, track_ids, measurements, now):
+        """Predict all tracks to now, update the measured ones, and return their states."""
+        self.predict(now)
+        self.update(track_ids, measurements, now)
+        return self.states(track_ids)
+
+    def states(self, track_ids):
+        """Smoothed positions (n, 2), velocities (n, 2) and position std (n,) for track_ids."""
+        slots = np.array([np.flatnonzero(self.ids == tid)[0] for tid in track_ids], dtype=np.intp)
+        if len(slots) == 0:
+            return np.empty((0, 2)), np.empty((0, 2)), np.empty(0)
+        sigma = np.sqrt(self.P[slots, 0, 0] + self.P[slots, 1, 1])
+        return self.x[slots, :2].copy(), self.x[slots, 2:].copy(), sigma
+
+    def prune(self, now, timeout):
+        """Drop tracks with no accepted measurement for timeout seconds."""
+        stale = (self.ids >= 0) & (now - self.updated > timeout)
+        self.ids[stale] = -1
+
+    def __len__(self):
+        return int((self.ids >= 0).sum())
+
+
+if debug == True and __name__ == "__main__":
     tracker = DistTracker()
     detection = [[740, 315, 16, 17], [786, 310, 32, 29], [724, 308, 10, 14], [552, 266, 26, 26], [450, 247, 28, 49], [256, 244, 67, 22], [566, 235, 38, 19]]
     tracker.update(detection)
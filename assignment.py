@@ -0,0 +1,19 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+# -------------------------------
+# Gated Optimal Assignment
+# -------------------------------
+GATED_COST = 1e6  # Stands in for "forbidden" so the assignment stays solvable
+
+
+def gated_assignment(cost, allowed):
+    """Minimum-cost assignment over an (N, M) cost matrix, using only allowed pairs.
+
+    Returns the row and column indices of the matched pairs.
+    """
+    cost = np.where(allowed, cost, GATED_COST)
+    rows, cols = linear_sum_assignment(cost)
+    keep = allowed[rows, cols]
+    return rows[keep], cols[keep]
@@ -0,0 +1,201 @@
+import argparse
+import math
+import time
+
+import cv2
+import numpy as np
+
+from capture import FRAME_WIDTH, FRAME_HEIGHT
+from detector import CASCADE_SCREEN_CONFIDENCE, CASCADE_SCREEN_IMGSZ, box_iou, load_detector, predict_pair
+from motion import KeyframeDetector
+from stereo import HORIZONTAL_FOV, PERSON_CLASS, DistanceTables, calculate_distance_from_disparity, match_persons
+
+
+def load_pairs(video1, video2, count):
+    """Read up to count stereo pairs from two recordings, resized to the working size."""
+    cap1 = cv2.VideoCapture(video1)
+    cap2 = cv2.VideoCapture(video2)
+    pairs = []
+    while len(pairs) < count:
+        ret1, frame1 = cap1.read()
+        ret2, frame2 = cap2.read()
+        if not ret1 or not ret2:
+            break
+        pairs.append((cv2.resize(frame1, (FRAME_WIDTH, FRAME_HEIGHT)),
+                      cv2.resize(frame2, (FRAME_WIDTH, FRAME_HEIGHT))))
+    cap1.release()
+    cap2.release()
+    print(f"[BENCH] Loaded {len(pairs)} pairs from {video1}, {video2}")
+    return pairs
+
+
+def time_pairs(name, fn, pairs, warmup=3):
+    """Time fn(frame1, frame2) over all pairs; prints latency and CPU usage per pair."""
+    for frame1, frame2 in pairs[:warmup]:
+        fn(frame1, frame2)
+
+    latencies = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for frame1, frame2 in pairs:
+        t0 = time.perf_counter()
+        fn(frame1, frame2)
+        latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(f"[BENCH] {name:<12} mean {mean * 1000:7.2f} ms/pair  p95 {p95 * 1000:7.2f} ms  "
+          f"CPU {cpu / len(pairs) * 1000:7.2f} ms/pair ({cpu / wall * 100:.0f}% of a core)")
+    return mean
+
+
+def bench_batch(args):
+    """Compare two sequential predict calls against one batched call per pair."""
+    model = load_detector(args.backend, args.model)
+    pairs = load_pairs(args.video1, args.video2, args.pairs)
+    sequential = time_pairs("sequential", lambda f1, f2: predict_pair(model, f1, f2, batched=False), pairs)
+    batched = time_pairs("batched", lambda f1, f2: predict_pair(model, f1, f2, batched=True), pairs)
+    print(f"[BENCH] Batched speedup: {sequential / batched:.2f}x")
+
+
+def bench_lut(args):
+    """Compare per-person np.interp/math.tan calls against one lookup-table gather per frame."""
+    rng = np.random.default_rng(0)
+    frames = [(rng.uniform(5, 120, args.people), rng.uniform(0, FRAME_WIDTH - 1, args.people))
+              for _ in range(args.pairs)]
+
+    def per_call():
+        for disparities, columns in frames:
+            for disparity, column in zip(disparities, columns):
+                distance = calculate_distance_from_disparity(disparity)
+                angle = (int(column) - FRAME_WIDTH / 2) / (FRAME_WIDTH / 2) * (HORIZONTAL_FOV / 2)
+                math.tan(math.radians(angle)) * distance
+
+    start = time.perf_counter()
+    tables = DistanceTables(FRAME_WIDTH)
+    build = time.perf_counter() - start
+
+    def gathered():
+        for disparities, columns in frames:
+            tables.distances(disparities) * tables.bearings(columns)
+
+    results = []
+    for name, fn in (("per-call", per_call), ("lookup", gathered)):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        results.append(elapsed)
+        print(f"[BENCH] {name:<12} {elapsed / args.pairs * 1e6:8.1f} us/frame "
+              f"({args.people} people)")
+    print(f"[BENCH] Table build {build * 1000:.1f} ms, lookup speedup {results[0] / results[1]:.1f}x")
+
+    # Sanity check: the tables must agree with the reference path
+    disparities, columns = frames[0]
+    reference = np.array([calculate_distance_from_disparity(d) for d in disparities])
+    error = np.max(np.abs(tables.distances(disparities) - reference))
+    print(f"[BENCH] Max distance difference vs reference: {error:.4f}")
+
+
+def person_boxes(detections, confidence_threshold=0.5):
+    keep = (detections.cls == PERSON_CLASS) & (detections.conf >= confidence_threshold)
+    return detections.xyxy[keep]
+
+
+def bench_keyframe(args):
+    """Compare full-rate detection against detect-every-N with optical-flow propagation.
+
+    Full-rate detections are the reference; recall is the share of reference person
+    boxes that the keyframe mode reproduces with IoU >= 0.5.
+    """
+    model = load_detector(args.backend, args.model)
+    pairs = load_pairs(args.video1, args.video2, args.pairs)
+    detect = lambda frames: list(predict_pair(model, frames[0], frames[1]))
+
+    modes = {"full-rate": detect, f"every {args.interval}": KeyframeDetector(detect, args.interval)}
+    outputs = {}
+    for name, fn in modes.items():
+        results = []
+        start = time.perf_counter()
+        for frame1, frame2 in pairs:
+            results.append(fn((frame1, frame2)))
+        elapsed = time.perf_counter() - start
+        outputs[name] = results
+        print(f"[BENCH] {name:<12} {len(pairs) / elapsed:6.1f} pairs/s")
+
+    reference, candidate = outputs.values()
+    found = total = 0
+    for reference_pair, candidate_pair in zip(reference, candidate):
+        for expected, got in zip(reference_pair, candidate_pair):
+            expected, got = person_boxes(expected), person_boxes(got)
+            total += len(expected)
+            if len(expected) and len(got):
+                found += int((box_iou(expected, got).max(axis=1) >= 0.5).sum())
+    recall = found / total if total else 1.0
+    print(f"[BENCH] Recall vs full-rate: {recall:.3f} ({found}/{total} person boxes)")
+    print(modes[f"every {args.interval}"].report())
+
+
+def bench_cascade(args):
+    """Run the screen and the full model on every pair to measure exact cascade recall and cost.
+
+    The cascade judges whole stereo pairs, so recall is per pair: a pair counts as a
+    person pair when the full model's detections give at least one stereo match (what
+    distance, zone and alarm logic need), and the cascade loses it when the screen
+    finds no person in either view.
+    """
+    full = load_detector(args.backend, args.model)
+    screen = load_detector(args.backend, args.screen_model or args.model, imgsz=args.screen_imgsz)
+    pairs = load_pairs(args.video1, args.video2, args.pairs)
+
+    person_pairs = passed = lost = 0
+    screen_time = full_time = 0.0
+    for frame1, frame2 in pairs:
+        start = time.perf_counter()
+        screened = screen.predict([frame1, frame2])
+        screen_time += time.perf_counter() - start
+        start = time.perf_counter()
+        confirmed = full.predict([frame1, frame2])
+        full_time += time.perf_counter() - start
+
+        screen_positive = any(len(person_boxes(d, args.screen_confidence)) for d in screened)
+        passed += screen_positive
+        matched1, _ = match_persons(confirmed[0], confirmed[1])
+        if len(matched1):
+            person_pairs += 1
+            lost += not screen_positive
+
+    count = len(pairs)
+    cascade_time = screen_time + full_time * passed / count
+    print(f"[BENCH] screen    {screen_time / count * 1000:7.2f} ms/pair (imgsz {args.screen_imgsz})")
+    print(f"[BENCH] full      {full_time / count * 1000:7.2f} ms/pair")
+    print(f"[BENCH] cascade   {cascade_time / count * 1000:7.2f} ms/pair, {passed}/{count} pairs confirmed")
+    recall = 1 - lost / person_pairs if person_pairs else 1.0
+    print(f"[BENCH] Recall {recall:.3f}: {lost} of {person_pairs} stereo person pairs rejected by the screen")
+
+
+BENCHMARKS = {
+    "batch": bench_batch,
+    "cascade": bench_cascade,
+    "keyframe": bench_keyframe,
+    "lut": bench_lut,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Camera pipeline microbenchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--backend", default="ultralytics", help="ultralytics, onnxruntime or opencv")
+    parser.add_argument("--model", default=None, help="Weights path (defaults to the backend's train11 model)")
+    parser.add_argument("--video1", default="Scene2Cam1_trimmed.mov")
+    parser.add_argument("--video2", default="Scene2Cam2_trimmed.mov")
+    parser.add_argument("--pairs", type=int, default=100)
+    parser.add_argument("--people", type=int, default=8, help="Detections per frame for the lut benchmark")
+    parser.add_argument("--interval", type=int, default=5, help="Detect every N pairs for the keyframe benchmark")
+    parser.add_argument("--screen-model", default=None, help="Screening weights for the cascade benchmark")
+    parser.add_argument("--screen-imgsz", type=int, default=CASCADE_SCREEN_IMGSZ)
+    parser.add_argument("--screen-confidence", type=float, default=CASCADE_SCREEN_CONFIDENCE)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,132 @@
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from capture import FRAME_WIDTH, FRAME_HEIGHT, FramePairer, capture_frames, open_capture
+from stereo import CALIBRATION_FILE, StereoCalibration
+
+
+# -------------------------------
+# Stereo Checkerboard Calibration Tool
+# -------------------------------
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+STEREO_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-5)
+CAPTURE_INTERVAL = 1.0  # Seconds between saved live captures, so the board can be moved
+
+
+def find_corners(frame, board):
+    """Return refined checkerboard corners for one frame, or None if the board is not fully visible."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    found, corners = cv2.findChessboardCorners(gray, board, cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE)
+    if not found:
+        return None
+    return cv2.cornerSubPix(gray, corners, (5, 5), (-1, -1), SUBPIX_CRITERIA)
+
+
+def capture_pairs(out_dir, count, board):
+    """Save synchronized checkerboard pairs from the live streams in ai_config.json."""
+    with open("ai_config.json", "r") as f:
+        config = json.load(f)
+
+    os.makedirs(os.path.join(out_dir, "left"), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, "right"), exist_ok=True)
+    pairer = FramePairer(tolerance_ms=config.get("sync_tolerance_ms", 33))
+    caps = [open_capture(config["camera1"], config.get("camera1_backend", "opencv"), 1),
+            open_capture(config["camera2"], config.get("camera2_backend", "opencv"), 2)]
+    for cam_id, cap in enumerate(caps, start=1):
+        threading.Thread(target=capture_frames, args=(cap, pairer, cam_id, cap.get(cv2.CAP_PROP_FPS)),
+                         daemon=True).start()
+
+    saved = 0
+    last_save = 0
+    while saved < count:
+        pair = pairer.wait_pair(timeout=0.1)
+        if pair is not None:
+            frame1, frame2, skew, _ = pair
+            both = find_corners(frame1, board) is not None and find_corners(frame2, board) is not None
+            if both and time.time() - last_save >= CAPTURE_INTERVAL:
+                cv2.imwrite(os.path.join(out_dir, "left", f"{saved:03d}.png"), frame1)
+                cv2.imwrite(os.path.join(out_dir, "right", f"{saved:03d}.png"), frame2)
+                saved += 1
+                last_save = time.time()
+                print(f"[CALIB] Saved pair {saved}/{count} (skew {skew * 1000:.1f} ms)")
+            cv2.imshow("Calibration", np.hstack([frame1, frame2]))
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    for cap in caps:
+        cap.release()
+    cv2.destroyAllWindows()
+
+
+def calibrate(image_dir, board, square_size):
+    """Compute stereo intrinsics, extrinsics and rectification from left/right image pairs."""
+    left_files = sorted(glob.glob(os.path.join(image_dir, "left", "*.png")))
+    right_files = sorted(glob.glob(os.path.join(image_dir, "right", "*.png")))
+    if len(left_files) != len(right_files):
+        raise ValueError(f"Found {len(left_files)} left and {len(right_files)} right images")
+
+    # Board corner positions in board units (z = 0 plane)
+    board_points = np.zeros((board[0] * board[1], 3), np.float32)
+    board_points[:, :2] = np.mgrid[0:board[0], 0:board[1]].T.reshape(-1, 2) * square_size
+
+    object_points, points1, points2 = [], [], []
+    for left_file, right_file in zip(left_files, right_files):
+        # Calibrate at the working resolution the detector sees
+        frame1 = cv2.resize(cv2.imread(left_file), (FRAME_WIDTH, FRAME_HEIGHT))
+        frame2 = cv2.resize(cv2.imread(right_file), (FRAME_WIDTH, FRAME_HEIGHT))
+        corners1 = find_corners(frame1, board)
+        corners2 = find_corners(frame2, board)
+        if corners1 is None or corners2 is None:
+            print(f"[CALIB] Board not found in both views, skipping {os.path.basename(left_file)}")
+            continue
+        object_points.append(board_points)
+        points1.append(corners1)
+        points2.append(corners2)
+
+    if len(object_points) < 5:
+        raise ValueError(f"Only {len(object_points)} usable pairs, need at least 5")
+    print(f"[CALIB] Using {len(object_points)} pairs")
+
+    size = (FRAME_WIDTH, FRAME_HEIGHT)
+    rms1, K1, D1, _, _ = cv2.calibrateCamera(object_points, points1, size, None, None)
+    rms2, K2, D2, _, _ = cv2.calibrateCamera(object_points, points2, size, None, None)
+    rms, K1, D1, K2, D2, R, T, _, _ = cv2.stereoCalibrate(
+        object_points, points1, points2, K1, D1, K2, D2, size,
+        criteria=STEREO_CRITERIA, flags=cv2.CALIB_FIX_INTRINSIC)
+    R1, R2, P1, P2, Q, _, _ = cv2.stereoRectify(K1, D1, K2, D2, size, R, T, alpha=0)
+    print(f"[CALIB] RMS reprojection error: left {rms1:.3f}, right {rms2:.3f}, stereo {rms:.3f} px")
+
+    return StereoCalibration({
+        "image_size": list(size),
+        "units": "in",
+        "rms": rms,
+        "pairs": len(object_points),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "K1": K1, "D1": D1, "K2": K2, "D2": D2, "R": R, "T": T,
+        "R1": R1, "R2": R2, "P1": P1, "P2": P2, "Q": Q,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stereo calibration from checkerboard pairs")
+    parser.add_argument("--images", default="calibration_images", help="Folder with left/ and right/ pairs")
+    parser.add_argument("--capture", type=int, default=0, help="First capture this many pairs from the live cameras")
+    parser.add_argument("--board", type=int, nargs=2, default=[9, 6], help="Inner corners per row and column")
+    parser.add_argument("--square-size", type=float, default=1.0, help="Checkerboard square size in inches")
+    parser.add_argument("--output", default=CALIBRATION_FILE)
+    args = parser.parse_args()
+
+    board = tuple(args.board)
+    if args.capture:
+        capture_pairs(args.images, args.capture, board)
+    calibration = calibrate(args.images, board, args.square_size)
+    calibration.save(args.output)
+    print(f"[CALIB] Baseline {calibration.baseline_in:.2f} in, focal {calibration.focal_px:.1f} px")
+    print(f"[CALIB] Saved to {args.output}")
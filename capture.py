@@ -0,0 +1,547 @@
+import cv2
+import subprocess
+import threading
+import time
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from collections import deque
+
+
+# Frame size and buffer setup
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 360
+QUEUE_SIZE = 10
+RING_SLOTS = QUEUE_SIZE * 2  # Headroom so frames held by the pairer are not overwritten
+
+
+# -------------------------------
+# Stereo Frame Pairing by Timestamp
+# -------------------------------
+class FramePairer:
+    """Pairs left/right frames by nearest capture timestamp within a skew tolerance.
+
+    Buffered frames may be views into capture buffers that get reused (shared-memory
+    ring slots, ffmpeg read buffers). A matched pair is copied out once when it is
+    taken, so the rest of the pipeline owns its pixels however long it holds them.
+    """
+
+    def __init__(self, tolerance_ms=33.0, maxlen=QUEUE_SIZE):
+        self.tolerance = tolerance_ms / 1000.0
+        self.buffers = (deque(), deque())
+        self.maxlen = maxlen
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)  # Signalled when both cameras have frames
+
+        # Stats, reset by report()
+        self.pairs = 0
+        self.dropped = [0, 0]   # Frames discarded because no partner was close enough
+        self.overflow = [0, 0]  # Frames discarded because the consumer fell behind
+        self.torn = 0           # Pairs discarded because a buffer was overwritten before the copy
+        self.skew_total = 0.0
+        self.skew_max = 0.0
+
+    def push(self, index, stamp, frame, valid=None):
+        """Add a frame from camera index 0 (left) or 1 (right).
+
+        valid, if given, is called after the frame is copied out and returns False
+        when the buffer behind frame was overwritten in the meantime.
+        """
+        with self.lock:
+            buf = self.buffers[index]
+            if len(buf) >= self.maxlen:
+                buf.popleft()
+                self.overflow[index] += 1
+            buf.append((stamp, frame, valid))
+            if self.buffers[1 - index]:
+                self.ready.notify()
+
+    def depth(self):
+        """Buffered frames per camera, as 'left/right'."""
+        return f"{len(self.buffers[0])}/{len(self.buffers[1])}"
+
+    def backlog(self):
+        """Pairs the consumer is behind by, at most."""
+        return min(len(self.buffers[0]), len(self.buffers[1]))
+
+    def get_pair(self):
+        """Return (frame1, frame2, skew_seconds, stamp) for the oldest matching pair, or None.
+
+        stamp is the older of the two capture times, for measuring end-to-end latency.
+        """
+        with self.lock:
+            return self._match()
+
+    def wait_pair(self, timeout=None):
+        """Block until a matching pair is available or timeout expires; None on timeout."""
+        with self.ready:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                pair = self._match()
+                if pair is not None:
+                    return pair
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.ready.wait(remaining)
+
+    def _match(self):
+        """Pop the oldest matching pair from the buffers. Caller must hold the lock."""
+        left, right = self.buffers
+        while left and right:
+            t1 = left[0][0]
+            t2 = right[0][0]
+            skew = t1 - t2
+
+            # Right head is older than anything left can pair with
+            if skew > self.tolerance:
+                right.popleft()
+                self.dropped[1] += 1
+                continue
+            # Left head is older than anything right can pair with
+            if skew < -self.tolerance:
+                left.popleft()
+                self.dropped[0] += 1
+                continue
+
+            # Within tolerance, but a closer partner may already be buffered
+            if len(right) > 1 and abs(t1 - right[1][0]) < abs(skew):
+                right.popleft()
+                self.dropped[1] += 1
+                continue
+            if len(left) > 1 and abs(left[1][0] - t2) < abs(skew):
+                left.popleft()
+                self.dropped[0] += 1
+                continue
+
+            _, frame1, valid1 = left.popleft()
+            _, frame2, valid2 = right.popleft()
+            frame1, frame2 = frame1.copy(), frame2.copy()
+            if (valid1 is not None and not valid1()) or (valid2 is not None and not valid2()):
+                self.torn += 1
+                continue
+            self.pairs += 1
+            self.skew_total += abs(skew)
+            self.skew_max = max(self.skew_max, abs(skew))
+            return frame1, frame2, skew, min(t1, t2)
+        return None
+
+    def report(self):
+        """Return a one-line summary of pairing stats since the last report and reset them."""
+        with self.lock:
+            avg = (self.skew_total / self.pairs * 1000) if self.pairs else 0.0
+            line = (f"[SYNC] pairs={self.pairs} "
+                    f"dropped={self.dropped[0]}/{self.dropped[1]} "
+                    f"overflow={self.overflow[0]}/{self.overflow[1]} torn={self.torn} "
+                    f"skew avg={avg:.1f}ms max={self.skew_max * 1000:.1f}ms "
+                    f"(tolerance {self.tolerance * 1000:.0f}ms)")
+            self.pairs = 0
+            self.dropped = [0, 0]
+            self.overflow = [0, 0]
+            self.torn = 0
+            self.skew_total = 0.0
+            self.skew_max = 0.0
+            return line
+
+
+# -------------------------------
+# FFmpeg rawvideo Capture Backend
+# -------------------------------
+FFMPEG_BINARY = "ffmpeg"
+FFMPEG_REPORT_INTERVAL = 5.0  # Seconds between decode stat prints
+
+
+class FFmpegCapture:
+    """cv2.VideoCapture-like reader that pipes pre-scaled rawvideo frames out of ffmpeg.
+
+    Scaling happens inside ffmpeg, and frames are read with readinto straight into
+    preallocated buffers, so no per-frame allocation or resize is needed in Python.
+    """
+
+    def __init__(self, url, cam_id=0, width=FRAME_WIDTH, height=FRAME_HEIGHT, buffers=RING_SLOTS,
+                 read_timeout=None):
+        self.cam_id = cam_id
+        self.shape = (height, width, 3)
+        self.frame_bytes = width * height * 3
+        # Rotate through several buffers so frames still held by the pairer stay intact
+        self.buffers = [np.empty(self.shape, dtype=np.uint8) for _ in range(buffers)]
+        self.next_buffer = 0
+
+        cmd = [FFMPEG_BINARY, "-loglevel", "error",
+               "-fflags", "nobuffer", "-flags", "low_delay"]
+        if read_timeout:
+            # Make ffmpeg exit instead of blocking forever on a silent stream
+            cmd += ["-rw_timeout", str(int(read_timeout * 1e6))]
+        cmd += ["-i", url,
+                "-an", "-vf", f"scale={width}:{height}",
+                "-pix_fmt", "bgr24", "-f", "rawvideo", "-"]
+        try:
+            self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, bufsize=0)
+        except OSError as e:
+            print(f"[FFMPEG] Could not start ffmpeg for camera {cam_id}: {e}")
+            self.proc = None
+
+        # Stats
+        self.frames = 0
+        self.bytes_read = 0
+        self.report_frames = 0
+        self.report_timer = time.monotonic()
+
+    def isOpened(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def get(self, prop):
+        # Live pipe: reads block until ffmpeg delivers, so there is no FPS to pace against
+        return 0
+
+    def read_into(self, dst):
+        """Fill dst (C-contiguous uint8, frame shape) with the next frame. Returns False at end."""
+        if self.proc is None:
+            return False
+        view = memoryview(dst).cast("B")
+        got = 0
+        while got < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+
+        self.frames += 1
+        self.report_frames += 1
+        self.bytes_read += got
+        now = time.monotonic()
+        if now - self.report_timer >= FFMPEG_REPORT_INTERVAL:
+            print(f"[FFMPEG] Camera {self.cam_id}: "
+                  f"decode {self.report_frames / (now - self.report_timer):.1f} fps, "
+                  f"{self.bytes_read / 1e6:.1f} MB read")
+            self.report_frames = 0
+            self.report_timer = now
+        return True
+
+    def read(self):
+        frame = self.buffers[self.next_buffer]
+        self.next_buffer = (self.next_buffer + 1) % len(self.buffers)
+        if not self.read_into(frame):
+            return False, None
+        return True, frame
+
+    def release(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+
+def open_capture(url, backend="opencv", cam_id=0, read_timeout=None, size=(FRAME_WIDTH, FRAME_HEIGHT)):
+    """Open a camera stream with the configured backend ("opencv" or "ffmpeg")."""
+    if backend == "ffmpeg":
+        return FFmpegCapture(url, cam_id, size[0], size[1], read_timeout=read_timeout)
+    if read_timeout:
+        timeout_ms = int(read_timeout * 1000)
+        return cv2.VideoCapture(url, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+                                                      cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms])
+    return cv2.VideoCapture(url)
+
+
+# -------------------------------
+# Automatic Reconnection
+# -------------------------------
+RECONNECT_STALL_TIMEOUT = 3.0  # Seconds without a frame before the stream counts as stalled
+RECONNECT_BACKOFF_START = 0.5
+RECONNECT_BACKOFF_MAX = 8.0
+CAPTURE_STATES = ("connecting", "connected", "reconnecting", "stopped")
+
+
+class CaptureStatus:
+    """Connection state and outage stats for one camera, readable from any process."""
+
+    def __init__(self, cam_id):
+        self.cam_id = cam_id
+        # state index, outage count, total outage seconds, current outage start (0 if up)
+        self.values = mp.Array("d", 4)
+
+    @property
+    def state(self):
+        return CAPTURE_STATES[int(self.values[0])]
+
+    def set_state(self, state):
+        self.values[0] = CAPTURE_STATES.index(state)
+
+    def begin_outage(self):
+        if self.values[3] == 0:
+            self.values[1] += 1
+            self.values[3] = time.monotonic()
+
+    def end_outage(self):
+        """Close the current outage and return its duration in seconds (0 if there was none)."""
+        start = self.values[3]
+        if start == 0:
+            return 0.0
+        duration = time.monotonic() - start
+        self.values[2] += duration
+        self.values[3] = 0
+        return duration
+
+    def current_outage(self):
+        start = self.values[3]
+        return time.monotonic() - start if start else 0.0
+
+    def summary(self):
+        return (f"cam{self.cam_id} {self.state} outages={int(self.values[1])} "
+                f"down={self.values[2] + self.current_outage():.1f}s")
+
+
+class ResilientCapture:
+    """Wraps a capture backend and reopens the stream with exponential backoff on failure.
+
+    A failed read or a stall longer than stall_timeout (enforced by the backend's
+    read timeout) triggers a reconnect; read() only returns False once stopped.
+    """
+
+    def __init__(self, url, backend="opencv", cam_id=0, status=None, stop=None,
+                 stall_timeout=RECONNECT_STALL_TIMEOUT, size=(FRAME_WIDTH, FRAME_HEIGHT)):
+        self.url = url
+        self.backend = backend
+        self.size = size
+        self.cam_id = cam_id
+        self.status = status or CaptureStatus(cam_id)
+        self.stop = stop or threading.Event()
+        self.stall_timeout = stall_timeout
+        self.backoff = RECONNECT_BACKOFF_START
+        self.status.set_state("connecting")
+        self.cap = open_capture(url, backend, cam_id, stall_timeout, size)
+
+    def isOpened(self):
+        return not self.stop.is_set()
+
+    def get(self, prop):
+        return self.cap.get(prop) if self.cap is not None else 0
+
+    def read(self):
+        while not self.stop.is_set():
+            if self.cap is not None and self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if ret:
+                    self._connected()
+                    return True, frame
+            self._reconnect()
+        return False, None
+
+    def read_into(self, dst):
+        while not self.stop.is_set():
+            if self.cap is not None and self.cap.isOpened() and self.cap.read_into(dst):
+                self._connected()
+                return True
+            self._reconnect()
+        return False
+
+    def _connected(self):
+        if self.status.state != "connected":
+            self.status.set_state("connected")
+            outage = self.status.end_outage()
+            if outage:
+                print(f"[CAPTURE] Camera {self.cam_id} reconnected after {outage:.1f}s")
+            else:
+                print(f"[CAPTURE] Camera {self.cam_id} connected")
+        self.backoff = RECONNECT_BACKOFF_START
+
+    def _reconnect(self):
+        if self.status.state == "connected":
+            print(f"[CAPTURE] Camera {self.cam_id} lost stream, reconnecting")
+        self.status.set_state("reconnecting")
+        self.status.begin_outage()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+        # Interruptible sleep so shutdown is not held up by the backoff
+        if self.stop.wait(self.backoff):
+            return
+        self.backoff = min(self.backoff * 2, RECONNECT_BACKOFF_MAX)
+        self.cap = open_capture(self.url, self.backend, self.cam_id, self.stall_timeout, self.size)
+
+    def release(self):
+        self.stop.set()
+        self.status.set_state("stopped")
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+# Frame Capture Thread
+def capture_frames(cap, pairer, cam_id, fps, size=(FRAME_WIDTH, FRAME_HEIGHT)):
+    """Thread function to capture frames and stamp them with their decode time."""
+    while True:
+        ret, frame = cap.read()
+        # Stamp right after decode; both cameras share this clock, unlike stream PTS
+        stamp = time.monotonic()
+        if not ret:
+            print(f"Video {cam_id} ended.")
+            break
+
+        if frame.shape[:2] != (size[1], size[0]):
+            frame = cv2.resize(frame, size)
+        pairer.push(cam_id - 1, stamp, frame)
+
+        # Control frame rate based on FPS (live pipes pace themselves)
+        if fps > 0:
+            time.sleep(1 / fps)
+
+
+# -------------------------------
+# Shared-Memory Frame Ring (capture processes)
+# -------------------------------
+class SharedFrameRing:
+    """Fixed-size frame slots in shared memory, each with a sequence number and timestamp.
+
+    One capture process writes, the inference process reads the slots as NumPy views
+    without copying or pickling the pixels.
+    """
+
+    def __init__(self, slots=RING_SLOTS, shape=(FRAME_HEIGHT, FRAME_WIDTH, 3), name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        header_bytes = -(-slots * 16 // 64) * 64  # seq + stamp per slot, cache-line aligned
+        frame_bytes = int(np.prod(self.shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self.seqs = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=0)
+        self.stamps = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=slots * 8)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=header_bytes)
+        if self.owner:
+            self.seqs[:] = -1
+        self.lapped = 0  # Frames the reader missed because the writer overwrote them first
+
+    def spec(self):
+        """Arguments another process needs to attach to this ring."""
+        return self.slots, self.shape, self.shm.name
+
+    @classmethod
+    def attach(cls, spec):
+        slots, shape, name = spec
+        return cls(slots, shape, name=name)
+
+    def begin_write(self, seq):
+        """Return the slot view for seq, marked invalid until commit()."""
+        slot = seq % self.slots
+        self.seqs[slot] = -1
+        return self.frames[slot]
+
+    def commit(self, seq, stamp):
+        slot = seq % self.slots
+        self.stamps[slot] = stamp
+        self.seqs[slot] = seq
+
+    def holds(self, seq):
+        """True while seq's slot has not been reopened for writing."""
+        return self.seqs is not None and self.seqs[seq % self.slots] == seq
+
+    def read(self, seq):
+        """Return (stamp, frame_view) for seq, or None if the slot was already overwritten.
+
+        The view stays valid only while holds(seq); copy it before the writer laps it.
+        """
+        slot = seq % self.slots
+        if self.seqs[slot] != seq:
+            self.lapped += 1
+            return None
+        return self.stamps[slot], self.frames[slot]
+
+    def close(self):
+        self.seqs = self.stamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views still held elsewhere; the OS releases the mapping at exit
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def capture_process(url, ring_spec, cam_id, notify, stop, backend="opencv", status=None):
+    """Process entry point: decode a stream and resize straight into a shared frame ring."""
+    ring = SharedFrameRing.attach(ring_spec)
+    size = (ring.shape[1], ring.shape[0])
+    if status is not None:
+        cap = ResilientCapture(url, backend, cam_id, status, stop, size=size)
+    else:
+        cap = open_capture(url, backend, cam_id, size=size)
+    if not cap.isOpened():
+        print(f"Error: Could not open video {cam_id}.")
+        notify.put(None)
+        ring.close()
+        return
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    print(f"Video {cam_id} FPS: {fps}")
+    seq = 0
+    while not stop.is_set():
+        if backend == "ffmpeg":
+            # ffmpeg already scaled the frame; read the pipe straight into the slot
+            ret = cap.read_into(ring.begin_write(seq))
+            stamp = time.monotonic()
+        else:
+            ret, frame = cap.read()
+            stamp = time.monotonic()  # System-wide clock, comparable across processes
+            if ret:
+                cv2.resize(frame, size, dst=ring.begin_write(seq))
+        if not ret:
+            print(f"Video {cam_id} ended.")
+            break
+
+        ring.commit(seq, stamp)
+        notify.put(seq)
+        seq += 1
+
+        # Control frame rate based on FPS (live pipes pace themselves)
+        if fps > 0:
+            time.sleep(1 / fps)
+
+    notify.put(None)
+    cap.release()
+    ring.close()
+
+
+class CaptureProcess:
+    """Runs capture_process for one camera and feeds its ring into a FramePairer."""
+
+    def __init__(self, url, pairer, cam_id, backend="opencv", reconnect=True, slots=RING_SLOTS,
+                 size=(FRAME_WIDTH, FRAME_HEIGHT)):
+        self.pairer = pairer
+        self.cam_id = cam_id
+        self.status = CaptureStatus(cam_id) if reconnect else None
+        self.ring = SharedFrameRing(slots, shape=(size[1], size[0], 3))
+        self.notify = mp.Queue()  # Carries only sequence numbers, never pixels
+        self.stop = mp.Event()
+        self.process = mp.Process(target=capture_process,
+                                  args=(url, self.ring.spec(), cam_id, self.notify, self.stop, backend, self.status),
+                                  daemon=True)
+        self.feeder = threading.Thread(target=self._feed, daemon=True)
+
+    def start(self):
+        self.process.start()
+        self.feeder.start()
+
+    def _feed(self):
+        while True:
+            seq = self.notify.get()
+            if seq is None:
+                break
+            item = self.ring.read(seq)
+            if item is None:
+                continue
+            stamp, frame = item
+            # The pairer copies the slot when it pairs it, then checks it was not reused meanwhile
+            self.pairer.push(self.cam_id - 1, stamp, frame, lambda seq=seq: self.ring.holds(seq))
+
+    def release(self):
+        self.stop.set()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
@@ -0,0 +1,547 @@
+import time
+
+import cv2
+import numpy as np
+
+
+# -------------------------------
+# Detector Backends
+# -------------------------------
+DEFAULT_MODELS = {
+    "ultralytics": "train11/weights/last.pt",
+    "onnxruntime": "train11/weights/last.onnx",
+    "opencv": "train11/weights/last.onnx",
+}
+MODEL_IMGSZ = 640       # Training size from train11/args.yaml
+MIN_CONFIDENCE = 0.25   # Same pre-filter ultralytics applies before NMS
+NMS_IOU = 0.7           # Same IoU ultralytics uses by default
+LETTERBOX_FILL = 114
+MODEL_STRIDE = 32       # Input sizes must be a multiple of the largest YOLOv8 stride
+TILE_SIZE = 640         # Tiles match the training size, so a tile is seen at native resolution
+TILE_OVERLAP = 0.2      # Share of a tile shared with its neighbour; a person cut by one edge is whole in the next tile
+TILE_SEAM_MARGIN = 2    # Pixels; a tile box this close to an inner tile edge is a cut-off part of someone
+TILE_MERGE_IOS = 0.6    # Intersection over the smaller box above which two boxes are the same person
+CASCADE_SCREEN_IMGSZ = 320           # Screening input size; a quarter of the pixels of MODEL_IMGSZ
+CASCADE_SCREEN_CONFIDENCE = MIN_CONFIDENCE  # As low as the backends report: the screen may pass extra frames, not drop people
+CASCADE_AUDIT_INTERVAL = 50          # Confirm every Nth rejected frame to measure the screen's misses
+
+
+class Detections:
+    """Boxes for one frame as NumPy arrays: xyxy (N, 4), conf (N,), cls (N,)."""
+
+    def __init__(self, xyxy, conf, cls, orig_img, names=None, result=None):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+        self.orig_img = orig_img
+        self.names = names or {0: "person"}
+        self.result = result  # Original ultralytics Results, kept for its own plot()
+
+    @classmethod
+    def empty(cls, frame, names=None):
+        """No boxes, for frames the detector was not run on."""
+        return cls(np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32),
+                   np.empty(0, dtype=int), frame, names)
+
+    def __len__(self):
+        return len(self.conf)
+
+    def plot(self):
+        """Return a copy of the frame with the boxes drawn on it."""
+        if self.result is not None:
+            return self.result.plot()
+        img = self.orig_img.copy()
+        for (x1, y1, x2, y2), conf, cls in zip(self.xyxy.astype(int), self.conf, self.cls):
+            label = f"{self.names.get(int(cls), int(cls))} {conf:.2f}"
+            cv2.rectangle(img, (x1, y1), (x2, y2), (255, 56, 56), 2)
+            cv2.putText(img, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 56, 56), 1)
+        return img
+
+
+class UltralyticsDetector:
+    """The original YOLO path on PyTorch."""
+
+    name = "ultralytics"
+
+    def __init__(self, path, imgsz=MODEL_IMGSZ):
+        from ultralytics import YOLO
+
+        self.model = YOLO(path)
+        self.imgsz = imgsz
+        self.fixed_size = False
+        self.square_input = False  # ultralytics letterboxes same-shape batches to the nearest stride multiple
+
+    def predict(self, frames, imgsz=None):
+        results = self.model.predict(frames, imgsz=imgsz or self.imgsz, verbose=False)
+        detections = []
+        for r in results:
+            boxes = r.boxes
+            detections.append(Detections(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                                         boxes.cls.cpu().numpy().astype(int), r.orig_img, r.names, r))
+        return detections
+
+
+class OnnxDetectorBase:
+    """Letterbox preprocessing and YOLOv8 output decoding shared by the ONNX backends."""
+
+    def __init__(self, path, imgsz=MODEL_IMGSZ):
+        self.path = path
+        self.imgsz = imgsz
+        self.names = {0: "person"}
+        self.fixed_size = True
+        self.square_input = True  # preprocess() always letterboxes to imgsz x imgsz
+
+    def preprocess(self, frames, imgsz=None):
+        """Letterbox frames to imgsz x imgsz; returns (NCHW float32 blob, scale, (pad_x, pad_y))."""
+        imgsz = imgsz or self.imgsz
+        h, w = frames[0].shape[:2]
+        r = min(imgsz / h, imgsz / w)
+        new_w, new_h = round(w * r), round(h * r)
+        pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+        batch = np.full((len(frames), imgsz, imgsz, 3), LETTERBOX_FILL, dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            if (new_w, new_h) != (w, h):
+                frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+            batch[i, pad_y:pad_y + new_h, pad_x:pad_x + new_w] = frame
+        blob = batch[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32) / 255.0  # BGR->RGB, NHWC->NCHW
+        return np.ascontiguousarray(blob), r, (pad_x, pad_y)
+
+    def postprocess(self, output, frames, r, pad):
+        """Decode (B, 4 + classes, anchors) YOLOv8 output into per-frame Detections."""
+        detections = []
+        for pred, frame in zip(output, frames):
+            pred = pred.T  # (anchors, 4 + classes)
+            scores = pred[:, 4:]
+            cls = scores.argmax(axis=1)
+            conf = scores[np.arange(len(scores)), cls]
+            keep = conf >= MIN_CONFIDENCE
+            boxes, conf, cls = pred[keep, :4], conf[keep], cls[keep]
+
+            xyxy = np.empty_like(boxes)
+            xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+            xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+            xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+            xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+
+            if len(conf):
+                # Offset boxes per class so NMS never suppresses across classes
+                offset = cls[:, None] * float(self.imgsz * 2)
+                nms_boxes = np.hstack([xyxy[:, :2] + offset, xyxy[:, 2:] - xyxy[:, :2]])
+                idx = cv2.dnn.NMSBoxes(nms_boxes.tolist(), conf.tolist(), MIN_CONFIDENCE, NMS_IOU)
+                idx = np.array(idx, dtype=int).reshape(-1)
+                xyxy, conf, cls = xyxy[idx], conf[idx], cls[idx]
+
+            # Undo the letterbox
+            xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / r
+            xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / r
+            h, w = frame.shape[:2]
+            xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+            xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+            detections.append(Detections(xyxy, conf, cls.astype(int), frame, self.names))
+        return detections
+
+    def predict(self, frames, imgsz=None):
+        if not isinstance(frames, (list, tuple)):
+            frames = [frames]
+        if self.fixed_size:
+            imgsz = None  # Static-shape export, only its own input size works
+        blob, r, pad = self.preprocess(frames, imgsz)
+        if self.fixed_batch and len(frames) > 1:
+            # Model exported with a static batch of 1
+            output = np.concatenate([self.forward(blob[i:i + 1]) for i in range(len(frames))])
+        else:
+            output = self.forward(blob)
+        return self.postprocess(output, frames, r, pad)
+
+
+class OnnxRuntimeDetector(OnnxDetectorBase):
+    """ONNX Runtime CPU backend for an ultralytics ONNX export."""
+
+    name = "onnxruntime"
+
+    def __init__(self, path, imgsz=MODEL_IMGSZ):
+        super().__init__(path, imgsz)
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch = model_input.shape[0] == 1
+        self.fixed_size = isinstance(model_input.shape[2], int)  # Dynamic exports name the axis instead
+
+        # ultralytics stores the class names in the ONNX metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if names:
+            import ast
+            self.names = ast.literal_eval(names)
+
+    def forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenCVDetector(OnnxDetectorBase):
+    """OpenCV DNN backend for an ultralytics ONNX export."""
+
+    name = "opencv"
+
+    def __init__(self, path, imgsz=MODEL_IMGSZ):
+        super().__init__(path, imgsz)
+        self.net = cv2.dnn.readNetFromONNX(path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.fixed_batch = True  # Static-shape exports only take one image
+
+    def forward(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+
+class CascadeDetector:
+    """Two-stage cascade: a cheap screening detector decides which stereo pairs the full model sees.
+
+    One predict call is one stereo pair: both frames, or all their ROI crops or tiles.
+    The screen (e.g. the same weights at a small imgsz) runs on all of them, and if
+    any screens positive at screen_confidence the whole call goes to the confirm
+    detector, so both views of a person always reach stereo matching. Every
+    audit_interval-th rejected pair is also confirmed, so the screen's misses are
+    measured and the running per-pair recall estimate stays honest.
+    """
+
+    name = "cascade"
+    whole_pair = True  # predict_pair/predict_rois must pass both views in one call
+
+    def __init__(self, screen, confirm, screen_confidence=CASCADE_SCREEN_CONFIDENCE,
+                 audit_interval=CASCADE_AUDIT_INTERVAL, person_confidence=0.5):
+        self.screen = screen
+        self.confirm = confirm
+        self.imgsz = confirm.imgsz
+        self.fixed_size = confirm.fixed_size
+        self.square_input = confirm.square_input
+        self.screen_confidence = screen_confidence
+        self.audit_interval = audit_interval
+        self.person_confidence = person_confidence  # What counts as a person for recall, as in match_persons
+
+        # Lifetime per-pair counts for the recall estimate
+        self.rejected = 0        # Pairs the screen turned away
+        self.audited = 0         # Rejected pairs confirmed anyway
+        self.audit_misses = 0    # ...where the full model found a person
+        self.confirmed_hits = 0  # Pairs passed by the screen where the full model found a person
+
+        # Stats, reset by report()
+        self.pairs = 0
+        self.passed = 0
+        self.confirmed = 0  # Passed plus audited
+        self.screen_time = 0.0
+        self.confirm_time = 0.0
+
+    def _has_person(self, detections, confidence):
+        return any(bool(np.any((d.cls == 0) & (d.conf >= confidence))) for d in detections)
+
+    def predict(self, frames, imgsz=None):
+        if not isinstance(frames, (list, tuple)):
+            frames = [frames]
+        screen_imgsz = None
+        if imgsz:
+            # Keep the screen's resolution ratio when the caller shrinks the input (ROI crops)
+            screen_imgsz = max(MODEL_STRIDE, round(imgsz * self.screen.imgsz / self.confirm.imgsz / MODEL_STRIDE) * MODEL_STRIDE)
+
+        start = time.perf_counter()
+        screened = self.screen.predict(list(frames), imgsz=screen_imgsz)
+        self.screen_time += time.perf_counter() - start
+        self.pairs += 1
+
+        positive = self._has_person(screened, self.screen_confidence)
+        audit = False
+        if positive:
+            self.passed += 1
+        else:
+            self.rejected += 1
+            audit = self.rejected % self.audit_interval == 0
+            if not audit:
+                return [Detections.empty(frame) for frame in frames]
+
+        start = time.perf_counter()
+        detections = self.confirm.predict(list(frames), imgsz=imgsz)
+        self.confirm_time += time.perf_counter() - start
+        self.confirmed += 1
+        found = self._has_person(detections, self.person_confidence)
+        if audit:
+            self.audited += 1
+            self.audit_misses += found
+        else:
+            self.confirmed_hits += found
+        return detections
+
+    def recall(self):
+        """Estimated share of person pairs the screen passes on, from the audited rejections."""
+        if self.audited == 0:
+            return 1.0
+        missed = self.audit_misses * self.rejected / self.audited
+        total = self.confirmed_hits + missed
+        return self.confirmed_hits / total if total else 1.0
+
+    def report(self):
+        """Return per-stage timing and pass rate since the last report, plus lifetime recall, and reset."""
+        pairs = max(self.pairs, 1)
+        confirmed = max(self.confirmed, 1)
+        line = (f"[CASCADE] screen {self.screen_time / pairs * 1000:.1f} ms/pair, "
+                f"confirm {self.confirm_time / confirmed * 1000:.1f} ms/pair, passed {self.passed}/{self.pairs} pairs, "
+                f"recall {self.recall():.3f} ({self.audit_misses} misses in {self.audited} audited pairs)")
+        self.pairs = 0
+        self.passed = 0
+        self.confirmed = 0
+        self.screen_time = 0.0
+        self.confirm_time = 0.0
+        return line
+
+
+BACKENDS = {
+    "ultralytics": UltralyticsDetector,
+    "onnxruntime": OnnxRuntimeDetector,
+    "opencv": OpenCVDetector,
+}
+
+
+def load_detector(backend="ultralytics", path=None, imgsz=MODEL_IMGSZ, frame_shape=(360, 640, 3), warmup=5):
+    """Create the configured backend and log its measured per-frame latency."""
+    if backend not in BACKENDS:
+        print(f"[DETECTOR] Unknown backend '{backend}', falling back to ultralytics")
+        backend = "ultralytics"
+    path = path or DEFAULT_MODELS[backend]
+    detector = BACKENDS[backend](path, imgsz)
+
+    frame = np.zeros(frame_shape, dtype=np.uint8)
+    detector.predict([frame])  # First call pays one-time setup
+    start = time.perf_counter()
+    for _ in range(warmup):
+        detector.predict([frame])
+    latency = (time.perf_counter() - start) / warmup
+    print(f"[DETECTOR] Using {detector.name} backend ({path}), {latency * 1000:.1f} ms/frame")
+    return detector
+
+
+def predict_pair(detector, frame1, frame2, batched=True, imgsz=None):
+    """Run the detector on a stereo pair and return (detections1, detections2).
+
+    Batched mode submits both frames in one predict call, so preprocessing and
+    dispatch overhead is paid once per pair instead of once per camera. Detectors
+    that judge a whole pair (CascadeDetector) always get both frames together.
+    """
+    if batched or getattr(detector, "whole_pair", False):
+        detections1, detections2 = detector.predict([frame1, frame2], imgsz=imgsz)
+        return detections1, detections2
+    detections1 = detector.predict([frame1], imgsz=imgsz)[0]
+    detections2 = detector.predict([frame2], imgsz=imgsz)[0]
+    return detections1, detections2
+
+
+def box_intersections(boxes1, boxes2):
+    """(N, M) intersection areas and the (N,) and (M,) box areas of two sets of xyxy boxes."""
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area1 = np.prod(boxes1[:, 2:] - boxes1[:, :2], axis=1)
+    area2 = np.prod(boxes2[:, 2:] - boxes2[:, :2], axis=1)
+    return inter, area1, area2
+
+
+def box_iou(boxes1, boxes2):
+    """(N, M) IoU matrix between two sets of xyxy boxes."""
+    inter, area1, area2 = box_intersections(boxes1, boxes2)
+    union = area1[:, None] + area2[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def box_ios(boxes1, boxes2):
+    """(N, M) intersection over the smaller box; 1 when one box lies inside the other."""
+    inter, area1, area2 = box_intersections(boxes1, boxes2)
+    smaller = np.minimum(area1[:, None], area2[None, :])
+    return np.divide(inter, smaller, out=np.zeros_like(inter), where=smaller > 0)
+
+
+def nms(xyxy, conf, cls, iou_threshold=NMS_IOU, overlap=box_iou):
+    """Class-aware greedy NMS on NumPy arrays; returns the kept indices, best first.
+
+    The overlap of every pair (box_iou, or box_ios to also catch a part of a box
+    inside the whole) is computed once as a matrix, so each kept box suppresses
+    all of its overlaps in one vectorized step.
+    """
+    order = np.argsort(-np.asarray(conf), kind="stable")
+    iou = overlap(xyxy[order], xyxy[order])
+    iou[np.asarray(cls)[order][:, None] != np.asarray(cls)[order][None, :]] = 0  # Never across classes
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1:] &= iou[i, i + 1:] <= iou_threshold
+    return order[keep]
+
+
+def tile_windows(frame_shape, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Overlapping tile windows (x0, y0, x1, y1) covering a frame, all the same size."""
+    height, width = frame_shape[:2]
+    tile_w, tile_h = min(tile, width), min(tile, height)
+
+    def starts(length, size):
+        if length <= size:
+            return [0]
+        count = int(np.ceil((length - size) / (size * (1 - overlap)))) + 1
+        return np.linspace(0, length - size, count).round().astype(int).tolist()
+
+    return [(x0, y0, x0 + tile_w, y0 + tile_h) for y0 in starts(height, tile_h) for x0 in starts(width, tile_w)]
+
+
+def overview_canvas(frame, shape):
+    """The whole frame shrunk into a tile-shaped canvas at the top-left; returns (canvas, scale)."""
+    height, width = frame.shape[:2]
+    r = min(shape[1] / width, shape[0] / height)
+    canvas = np.full(shape, LETTERBOX_FILL, dtype=np.uint8)
+    new_w, new_h = round(width * r), round(height * r)
+    canvas[:new_h, :new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return canvas, r
+
+
+def predict_tiles(detector, frames, spans=None, tile=TILE_SIZE, overlap=TILE_OVERLAP, output_frames=None,
+                  imgsz=None):
+    """Detect on overlapping tiles of full-resolution frames in one batch.
+
+    Each frame also gets a downscaled whole-frame pass in the same batch, for people
+    too tall for one tile. Tile boxes touching an inner tile edge are cut-off parts
+    and are dropped; the overview or the overlapping neighbour tile has the whole
+    person. The rest are merged with nms() on intersection over the smaller box, so
+    a partial box inside a whole one never survives. Tiles whose columns miss every
+    span in spans (one list of (lo, hi) per frame, full-resolution pixels) are
+    skipped. With output_frames, the boxes are scaled to those frames' size and the
+    Detections draw on them, so the rest of the pipeline keeps its working resolution.
+    imgsz below detector.imgsz shrinks the tiles' input size by the same ratio.
+    """
+    output_frames = output_frames or frames
+    crops, owners = [], []  # owners: (frame index, x0, y0, scale, tile window or None for the overview)
+    for index, frame in enumerate(frames):
+        windows = tile_windows(frame.shape, tile, overlap)
+        x0, y0, x1, y1 = windows[0]
+        canvas, r = overview_canvas(frame, (y1 - y0, x1 - x0, 3))
+        crops.append(canvas)
+        owners.append((index, 0, 0, r, None))
+        for window in windows:
+            x0, y0, x1, y1 = window
+            if spans is not None and not any(x0 < hi and lo < x1 for lo, hi in spans[index]):
+                continue
+            crops.append(frame[y0:y1, x0:x1])
+            owners.append((index, x0, y0, 1.0, window))
+    tile_imgsz = tile
+    if imgsz:
+        tile_imgsz = max(MODEL_STRIDE, round(tile * imgsz / detector.imgsz / MODEL_STRIDE) * MODEL_STRIDE)
+    tile_detections = detector.predict(crops, imgsz=tile_imgsz)
+
+    detections = []
+    for index, (frame, output) in enumerate(zip(frames, output_frames)):
+        height, width = frame.shape[:2]
+        boxes, confs, classes = [], [], []
+        for d, (owner, x0, y0, r, window) in zip(tile_detections, owners):
+            if owner != index:
+                continue
+            xyxy = d.xyxy.astype(np.float64)
+            keep = np.ones(len(xyxy), dtype=bool)
+            if window is not None:
+                wx0, wy0, wx1, wy1 = window
+                keep &= ~((xyxy[:, 0] <= TILE_SEAM_MARGIN) & (wx0 > 0))
+                keep &= ~((xyxy[:, 1] <= TILE_SEAM_MARGIN) & (wy0 > 0))
+                keep &= ~((xyxy[:, 2] >= wx1 - wx0 - TILE_SEAM_MARGIN) & (wx1 < width))
+                keep &= ~((xyxy[:, 3] >= wy1 - wy0 - TILE_SEAM_MARGIN) & (wy1 < height))
+            boxes.append(xyxy[keep] / r + np.array([x0, y0, x0, y0]))
+            confs.append(d.conf[keep])
+            classes.append(d.cls[keep])
+        xyxy, conf, cls = np.concatenate(boxes), np.concatenate(confs), np.concatenate(classes)
+        if len(conf) == 0:
+            detections.append(Detections.empty(output))
+            continue
+        keep = nms(xyxy, conf, cls, TILE_MERGE_IOS, overlap=box_ios)
+        scale = output.shape[1] / width, output.shape[0] / height
+        xyxy = xyxy[keep] * np.array([scale[0], scale[1], scale[0], scale[1]])
+        detections.append(Detections(xyxy.astype(np.float32), conf[keep], cls[keep], output,
+                                     tile_detections[0].names))
+    return detections
+
+
+def roi_crops(frame_shape, spans, crop_width):
+    """Full-height crop windows (x0, x1) of crop_width columns centered on each span of a frame.
+
+    All crops share one width so they can go through the detector as one batch.
+    """
+    width = frame_shape[1]
+    crop_width = min(width, crop_width)
+    windows = []
+    for lo, hi in spans:
+        x0 = int(np.clip(round((lo + hi - crop_width) / 2), 0, width - crop_width))
+        windows.append((x0, x0 + crop_width))
+    return windows
+
+
+def merge_windows(windows):
+    """Merge crop windows (x0, x1) that overlap, so no column is detected twice."""
+    merged = []
+    for x0, x1 in sorted(windows):
+        if merged and x0 < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], x1))
+        else:
+            merged.append((x0, x1))
+    return merged
+
+
+def predict_rois(detector, frames, spans, batched=True, imgsz=None):
+    """Run the detector only inside column spans of each frame.
+
+    spans holds a list of (lo, hi) pixel columns per frame. All crops go through one
+    predict call at an input size scaled to the crop, so inference work shrinks with
+    the area covered, and the boxes are mapped back to full-frame Detections. imgsz
+    is the full-frame input size to scale from (detector.imgsz by default).
+
+    Backends with a fixed or square input pad every crop back up to a full square
+    input, so N crops would cost N whole frames; those run on the whole frames instead.
+    """
+    if detector.fixed_size or detector.square_input:
+        if batched or getattr(detector, "whole_pair", False):
+            return detector.predict(list(frames), imgsz=imgsz)
+        return [detector.predict([frame], imgsz=imgsz)[0] for frame in frames]
+    if not any(spans):
+        return [Detections.empty(frame) for frame in frames]
+    height, width = frames[0].shape[:2]
+    while True:
+        crop_width = min(width, max(int(np.ceil(hi - lo)) for frame_spans in spans for lo, hi in frame_spans))
+        windows = [roi_crops(frame.shape, frame_spans, crop_width) for frame, frame_spans in zip(frames, spans)]
+        # Widening to a shared width can make windows overlap; a person in the overlap
+        # would come back twice, so merge them and widen again until none overlap
+        merged = [merge_windows(frame_windows) for frame_windows in windows]
+        if merged == [sorted(frame_windows) for frame_windows in windows]:
+            break
+        spans = merged
+
+    # Keep the full-frame pixel scale: a 640-wide frame at imgsz 640 means a 320-wide crop at 320
+    full_imgsz = imgsz or detector.imgsz
+    scale = full_imgsz / max(height, width)
+    imgsz = int(np.ceil(max(height, crop_width) * scale / MODEL_STRIDE) * MODEL_STRIDE)
+    imgsz = min(imgsz, full_imgsz)
+
+    crops, owners = [], []
+    for index, (frame, frame_windows) in enumerate(zip(frames, windows)):
+        for x0, x1 in frame_windows:
+            crops.append(frame[:, x0:x1])
+            owners.append((index, x0))
+    if batched or getattr(detector, "whole_pair", False):
+        crop_detections = detector.predict(crops, imgsz=imgsz)
+    else:
+        crop_detections = [detector.predict([crop], imgsz=imgsz)[0] for crop in crops]
+
+    detections = []
+    for index, frame in enumerate(frames):
+        parts = [(d, x0) for d, (owner, x0) in zip(crop_detections, owners) if owner == index]
+        if not parts:
+            detections.append(Detections.empty(frame))
+            continue
+        xyxy = np.concatenate([d.xyxy + np.array([x0, 0, x0, 0], dtype=d.xyxy.dtype) for d, x0 in parts])
+        conf = np.concatenate([d.conf for d, _ in parts])
+        cls = np.concatenate([d.cls for d, _ in parts])
+        detections.append(Detections(xyxy, conf, cls, frame, parts[0][0].names))
+    return detections
@@ -1,15 +1,21 @@
 import cv2
-import torch
-from ultralytics import YOLO
 import threading
 import numpy as np
-from queue import Queue
 import time
 import serial
-import math
 import smtplib
 from email.mime.text import MIMEText
 import socket, pickle, struct, os
+from capture import (FRAME_WIDTH, FRAME_HEIGHT, FramePairer, CaptureProcess, ResilientCapture,
+                     capture_frames, open_capture)
+from detector import (CASCADE_AUDIT_INTERVAL, CASCADE_SCREEN_CONFIDENCE, CASCADE_SCREEN_IMGSZ, MODEL_IMGSZ,
+                      CascadeDetector, Detections, load_detector, predict_pair, predict_rois, predict_tiles)
+from motion import KEEPALIVE_INTERVAL, KEYFRAME_INTERVAL, KeyframeDetector, MotionGate
+from ObjectTracker import KalmanTracker, TrackStore, associate
+from pipeline import ResolutionScheduler, Stage, StageQueue
+from stereo import (CALIBRATION_FILE, DISTANCE_CALIBRATION_FILE, ROI_MARGIN_FT, DistanceTables, StereoCalibration,
+                    box_disparities, estimate_distances, load_distance_model, match_persons, triangulate_pairs,
+                    zone_column_spans)
 
 
 recording = False
@@ -26,23 +32,39 @@ with open("ai_config.json", "r") as f:
 
 camera1 = config.get("camera1")
 camera2 = config.get("camera2")
-
-
-print("finalCamera has start!")
-
-import socket
-# -------------------------------
-# Serial Communication with Arduinos
-# -------------------------------
-arduino_port = "COM6" #change depending on device (COM3 or 6)
-baud_rate = 9600
-
-try:
-    arduino = serial.Serial(arduino_port, baud_rate, timeout=1)
-    print(f"Connected to Arduino on {arduino_port}")
-except Exception as e:
-    print(f"Error connecting to Arduino: {e}")
-    arduino = None
+sync_tolerance_ms = config.get("sync_tolerance_ms", 33)
+capture_mode = config.get("capture_mode", "process")  # "process" (shared memory) or "thread"
+camera1_backend = config.get("camera1_backend", "opencv")  # "opencv" or "ffmpeg"
+camera2_backend = config.get("camera2_backend", "opencv")
+reconnect = config.get("reconnect", True)  # Reopen dropped streams with backoff
+batch_inference = config.get("batch_inference", True)  # One predict call per stereo pair
+inference_backend = config.get("inference_backend", "ultralytics")  # "ultralytics", "onnxruntime" or "opencv"
+model_path = config.get("model_path")  # None picks the backend's default train11 weights
+pipelined = config.get("pipelined", True)  # Overlap inference, post-processing and rendering
+max_row_offset = config.get("max_row_offset_px", 40)  # Epipolar gate for stereo matching
+max_disparity = config.get("max_disparity_px", 250)
+disparity_sign = config.get("disparity_sign", 1)  # -1 if camera1 is the right-hand camera
+calibration_file = config.get("calibration_file", CALIBRATION_FILE)
+distance_calibration_file = config.get("distance_calibration_file", DISTANCE_CALIBRATION_FILE)
+motion_gating = config.get("motion_gating", False)  # Skip the detector while both cameras are static
+motion_keepalive = config.get("motion_keepalive_s", KEEPALIVE_INTERVAL)
+roi_inference = config.get("roi_inference", False)  # Only run the detector on the image columns the zones cover
+roi_margin_ft = config.get("roi_margin_ft", ROI_MARGIN_FT)
+keyframe_interval = config.get("keyframe_interval", KEYFRAME_INTERVAL)  # Detect every N pairs, flow in between
+zone_guard_ft = config.get("zone_guard_ft", 3.0)  # Always detect when someone is this close to a zone
+tiled_inference = config.get("tiled_inference", False)  # Detect on full-resolution tiles for distant people
+tile_capture_size = (config.get("tile_capture_width", 1920), config.get("tile_capture_height", 1080))
+tile_skip_outside_zones = config.get("tile_skip_outside_zones", True)
+cascade = config.get("cascade", False)  # Screen every frame with a cheap pass, confirm positives with train11
+cascade_screen_model = config.get("cascade_screen_model")  # None screens with the main weights at a small imgsz
+cascade_screen_imgsz = config.get("cascade_screen_imgsz", CASCADE_SCREEN_IMGSZ)
+cascade_screen_confidence = config.get("cascade_screen_confidence", CASCADE_SCREEN_CONFIDENCE)
+cascade_audit_interval = config.get("cascade_audit_interval", CASCADE_AUDIT_INTERVAL)
+adaptive_resolution = config.get("adaptive_resolution", False)  # Lower imgsz under load, full size near zones
+min_imgsz = config.get("min_imgsz", 320)
+max_imgsz = config.get("max_imgsz", MODEL_IMGSZ)
+resolution_latency_high = config.get("resolution_latency_high_ms", 250) / 1000
+resolution_latency_low = config.get("resolution_latency_low_ms", 120) / 1000
 
 
 class PersistentSocketClient:
@@ -77,8 +99,6 @@ class PersistentSocketClient:
             self.sock = None
 
 
-sock = PersistentSocketClient("10.0.0.2", 10000)
-
 def command_listener():
     global recording, video_writer
 
@@ -108,29 +128,28 @@ def command_listener():
                     recording = False
                     print("[RECORD] Stopped")
 
-threading.Thread(target=command_listener, daemon=True).start()
-
-# Video file paths
-# stream_url_1 = "http://192.168.1.134:8080"
-# stream_url_2 = "http://192.168.1.107:8080"
-stream_url_1 = camera1
-stream_url_2 = camera2
-
-# Load YOLO model
-model = YOLO('train11/weights/last.pt')
-
 # Camera parameters
 focal_length = 700  # Focal length in pixels
 baseline_in = 18   # Distance between cameras in meters
 
-# Frame size and queue setup
-FRAME_WIDTH = 640
-FRAME_HEIGHT = 360
-QUEUE_SIZE = 10
+# Stereo calibration from calibrate.py, if one has been run for this site
+calibration = StereoCalibration.load(calibration_file)
+if calibration is not None:
+    focal_length = calibration.focal_px
+    baseline_in = calibration.baseline_in
+    disparity_sign = calibration.disparity_sign
 
-# Frame queues
-queue1 = Queue(maxsize=QUEUE_SIZE)
-queue2 = Queue(maxsize=QUEUE_SIZE)
+# Disparity -> distance and column -> bearing lookup tables for the uncalibrated path,
+# using the correction fitted by fitdistance.py when there is one
+distance_model = load_distance_model(distance_calibration_file)
+distance_tables = DistanceTables(FRAME_WIDTH, focal_length, baseline_in, model=distance_model)
+
+# Stereo pairing setup
+pairer = FramePairer(tolerance_ms=sync_tolerance_ms)
+PAIR_WAIT_TIMEOUT = 0.1  # Seconds between window event pumps while idle
+
+# Background-subtraction gate in front of the detector
+motion_gate = MotionGate(keepalive=motion_keepalive) if motion_gating else None
 
 # Email to SMS configuration
 smtp_server = 'smtp.gmail.com'
@@ -195,6 +214,24 @@ zones = {
 }
 
 
+# Image columns each camera needs to look at for the zones, for ROI inference and tile skipping
+roi_spans = None
+tile_spans = None
+if roi_inference or (tiled_inference and tile_skip_outside_zones):
+    zone_spans = zone_column_spans(zones, FRAME_WIDTH, distance_tables, calibration,
+                                   distance_model["scale_factor"], roi_margin_ft)
+    for camera, spans in enumerate(zone_spans, start=1):
+        covered = sum(hi - lo for lo, hi in spans)
+        columns = ", ".join(f"{lo:.0f}-{hi:.0f}" for lo, hi in spans) or "none"
+        print(f"[ROI] Camera {camera} columns {columns} ({covered / FRAME_WIDTH * 100:.0f}% of frame)")
+    if tiled_inference:
+        # Tiles are cut from the full-resolution frames
+        tile_scale = tile_capture_size[0] / FRAME_WIDTH
+        tile_spans = [[(lo * tile_scale, hi * tile_scale) for lo, hi in spans] for spans in zone_spans]
+    else:
+        roi_spans = zone_spans
+
+
 # Helper to check if real-world (x, y) is inside a zone
 def is_point_in_zone(xy_point, zone_polygon):
     """Check if a (x, y) world-coordinate point is inside a zone polygon."""
@@ -202,369 +239,409 @@ def is_point_in_zone(xy_point, zone_polygon):
     return cv2.pointPolygonTest(zone_int, (int(xy_point[0]), int(xy_point[1])), False) >= 0
 
 
+ZONE_LOOKAHEAD = 1.0  # Seconds of constant velocity used to spot someone heading into a zone
 
 
-# Frame Capture Thread
-def capture_frames(cap, queue, cam_id, fps):
-    """Thread function to capture frames from video files."""
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print(f"Video {cam_id} ended.")
-            break
-
-        frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
-
-        if queue.full():
-            queue.get()
-        queue.put(frame)
-
-        # Control frame rate based on FPS
-        time.sleep(1 / fps)
-
-
-# Distance Calculation Using Bounding Box Centers
-def calculate_distance_from_disparity(disparity):
-    """
-    Calculates distance (in feet) from disparity (in pixels) based on an inverse fit.
-    Tuned for 18-inch baseline, Arducam OV5647 stereo cameras.
-    """
-    if disparity <= 0:
-        return None  # Prevent division by zero or negative disparities
-    
-    # # Updated inverse model
-
-    # if disparity > 21.1:
-    #     # Close range formula (5-20 ft)
-    #     A = 448.77
-    #     B = 0.53
-    #     distance_ft = A / (disparity + B)
-
-    # elif 18 < disparity <= 21.1:
-    #     # Medium range formula ( 25 ft)
-    #     A = 520
-    #     B = 0.4
-    #     distance_ft = A / (disparity + B)
-
-    # else:
-    #     # Far range formula (30 ft)
-    #     A = 775.5  10 13 17
-    #     B = 9.24
-    #     distance_ft = A / (disparity + B)
-    baseline = baseline_in * 0.0254
-    distance = (focal_length*baseline)/disparity
-    input_points = [10, 15, 20, 25, 30]         # Raw distances
-    scale_factors = [0.9901, 1.0791, 1.1429, 1.24, 1.4]
-    offsets =      [-0.3, -0.3, -0.4, -0.5, -0.6]
-    scale = np.interp(distance, input_points, scale_factors)
-    offset = np.interp(distance, input_points, offsets)
-    corrected = distance * scale + offset
-    return corrected
-
-
-def non_max_suppression(boxes, iou_threshold=0.5):
-    """Applies NMS to filter out overlapping boxes."""
-    if len(boxes) == 0:
-        return []
-
-    boxes = sorted(boxes, key=lambda x: x[-1], reverse=True)  # Sort by confidence
-    filtered = []
-
-    while boxes:
-        best = boxes.pop(0)
-        filtered.append(best)
-
-        boxes = [box for box in boxes if iou(box, best) < iou_threshold]
-
-    return filtered
+def near_any_zone(positions, velocities, guard_ft):
+    """True if any world point, now or ZONE_LOOKAHEAD seconds ahead, is within guard_ft of a zone."""
+    points = np.concatenate([positions, positions + velocities * ZONE_LOOKAHEAD])
+    for polygon in zones.values():
+        for x, y in points:
+            if cv2.pointPolygonTest(polygon, (float(x), float(y)), True) >= -guard_ft:
+                return True
+    return False
 
 
-def iou(box1, box2):
-    """Calculate IoU between two boxes (xyxy format)."""
-    x1 = max(box1[0], box2[0])
-    y1 = max(box1[1], box2[1])
-    x2 = min(box1[2], box2[2])
-    y2 = min(box1[3], box2[3])
-
-    inter_area = max(0, x2 - x1) * max(0, y2 - y1)
-    box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-    box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
-
-    union_area = box1_area + box2_area - inter_area
-    return inter_area / union_area if union_area != 0 else 0
-
-
-# Nearest Neighbor Matching for Accurate Pairing
-def match_persons(results1, results2, confidence_threshold=0.5):
-    def extract_people(results):
-        return [
-            box.xyxy[0].tolist() + [box.conf[0].item()]
-            for box in results.boxes
-            if int(box.cls[0]) == 0 and box.conf[0] >= confidence_threshold
-        ]
-
-    persons1 = extract_people(results1)
-    persons2 = extract_people(results2)
-
-    if not persons1 or not persons2:
-        return []
-
-    matched_pairs = []
-    used_indices = set()
-
-    for p1 in persons1:
-        x1c = (p1[0] + p1[2]) / 2
-        y1c = (p1[1] + p1[3]) / 2
-        h1 = p1[3] - p1[1]
-
-        best_idx = -1
-        best_score = float('inf')
-
-        for idx, p2 in enumerate(persons2):
-            if idx in used_indices:
-                continue
-
-            x2c = (p2[0] + p2[2]) / 2
-            y2c = (p2[1] + p2[3]) / 2
-            h2 = p2[3] - p2[1]
-
-            center_dist = math.hypot(x1c - x2c, y1c - y2c)
-            height_diff = abs(h1 - h2)
-
-            score = center_dist + height_diff * 2  # Weight height difference
-
-            if score < best_score:
-                best_score = score
-                best_idx = idx
-
-        if best_idx != -1:
-            matched_pairs.append((p1, persons2[best_idx]))
-            used_indices.add(best_idx)
-
-    return matched_pairs
-
-
-
-# Video Initialization
-cap1 = cv2.VideoCapture(stream_url_1)
-cap2 = cv2.VideoCapture(stream_url_2)
-
-if not cap1.isOpened() or not cap2.isOpened():
-    print("Error: Could not open video files.")
-    exit()
-
-# Get FPS from video files
-fps1 = cap1.get(cv2.CAP_PROP_FPS)
-fps2 = cap2.get(cv2.CAP_PROP_FPS)
-fps = min(fps1, fps2)  # Use the lower FPS to prevent desync
-print(f"Video 1 FPS: {fps1}")
-print(f"Video 2 FPS: {fps2}")
-print(f"Using FPS: {fps}")
-
-# Start frame capture threads
-thread1 = threading.Thread(target=capture_frames, args=(cap1, queue1, 1, fps))
-thread2 = threading.Thread(target=capture_frames, args=(cap2, queue2, 2, fps))
-thread1.start()
-thread2.start()
-
-# Display Loop with Combined Frames, Distance, and Disparity
-# Tracking dictionaries before loop
+# Tracking dictionaries, owned by the post-process stage
 next_id = 0
 id_memory = {}  # {id: (center_x, center_y)}
 id_timestamps = {}
 id_timeout = 1.0
-prev_dists = {}
-disparity_history = {}
+# Smoothed world position and velocity per assigned ID; uncalibrated disparity is noisier
+world_tracker = KalmanTracker(focal_px=focal_length, baseline_ft=baseline_in / 12,
+                              disparity_std=1.0 if calibration is not None else 2.0)
+disparity_history = TrackStore(capacity=64, history=10, timeout=id_timeout)
 frame_count = 10
+approaching_zone = False  # Set by the post stage, read by the inference stage
 text_alert_sent = False
 last_alert_time = 0
 cooldown_duration = 10
 
-while True:
-    if not queue1.empty() and not queue2.empty():
-        frame1 = queue1.get()
-        frame2 = queue2.get()
-
-        frame1 = cv2.resize(frame1, (FRAME_WIDTH, FRAME_HEIGHT))
-        frame2 = cv2.resize(frame2, (FRAME_WIDTH, FRAME_HEIGHT))
-
-        results1 = model.predict(frame1, verbose=False)[0]
-        results2 = model.predict(frame2, verbose=False)[0]
-
-        frame1_resized = results1.plot()
-        frame2_resized = results2.plot()
-
-        pairs = match_persons(results1, results2, confidence_threshold=0.5)
-
-        intrusion_detected = False
-        blue_zone_intrusion = False
-        distances = []
-        disparities = []
-        new_id_memory = {}
-        current_time = time.time()
-
-        for i, (box1, box2) in enumerate(pairs):
-            conf1 = box1[-1]
-            conf2 = box2[-1]
-            if conf1 < 0.5 or conf2 < 0.5:
-                continue
-
-            height1 = box1[3] - box1[1]
-            height2 = box2[3] - box2[1]
-            if abs(height1 - height2) > 50:
-                continue
-
-            center_x = int((box1[0] + box1[2]) / 2)
-            center_y = int((box1[1] + box1[3]) / 2)
-
-            # Assign persistent ID
-            assigned_id = None
-            min_dist = float('inf')
-            for pid, (prev_x, prev_y, prev_height) in id_memory.items():
-                if current_time - id_timestamps.get(pid, 0) > id_timeout:
-                    continue
-                dist = math.hypot(center_x - prev_x, center_y - prev_y)
-                height_diff = abs(height1 - prev_height)
-                if dist < 60 and height_diff < 30 and dist < min_dist:
-                    assigned_id = pid
-                    min_dist = dist
-
-            if assigned_id is None:
-                assigned_id = next_id
-                next_id += 1
-
-            new_id_memory[assigned_id] = (center_x, center_y, height1)
-            id_timestamps[assigned_id] = current_time
-
-            # Calculate disparity
-            left_disp = abs(box1[0] - box2[0])
-            right_disp = abs(box1[2] - box2[2])
-            center_disp = abs((box1[0] + box1[2]) / 2 - (box2[0] + box2[2]) / 2)
-            disparity = np.median([left_disp, right_disp, center_disp])
-
-            pair_key = f"{assigned_id}"
-            disparity_history.setdefault(pair_key, []).append(disparity)
-            if len(disparity_history[pair_key]) > 10:
-                disparity_history[pair_key].pop(0)
-
-            if len(disparity_history[pair_key]) < 3:
-                continue
-
-            smoothed_disparity = np.median(disparity_history[pair_key])
-            distance = calculate_distance_from_disparity(smoothed_disparity)
-
-            if distance is None:
-                if height1 > 0:
-                    distance = 2000 / height1
-                else:
-                    continue
-
-            pixel_estimate = 2000 / height1
-            distance = 0.6 * distance + 0.4 * pixel_estimate
-
-            if height1 < 100:
-                distance *= 0.9
-            elif height1 > 250:
-                distance *= 1.05
-
-            if pair_key in prev_dists:
-                prev_distance = prev_dists[pair_key]
-                if abs(prev_distance - distance) > 5:
-                    distance = prev_distance
-                else:
-                    distance = 0.8 * prev_distance + 0.2 * distance
-            prev_dists[pair_key] = distance
-
-            scale_factor = 2.0
-            distance *= scale_factor
-            distances.append(distance)
-            disparities.append(smoothed_disparity)
-
-            # Convert to real-world point
-            horizontal_fov = 70
-            angle_from_center = (center_x - FRAME_WIDTH / 2) / (FRAME_WIDTH / 2) * (horizontal_fov / 2)
-            x_world = math.tan(math.radians(angle_from_center)) * distance
-            y_world = distance
-            point_world = (x_world, y_world)
-
-            # Zone checks
-            zone_label = "None"
-            zone_color = (200, 200, 200)
-
-            if is_point_in_zone(point_world, zones["red"]):
-                zone_label = "Red Zone"
-                zone_color = (0, 0, 255)
-                intrusion_detected = True
+
+def detect_frames(frames):
+    """Run the detector on a stereo pair: whole frames, zone-column crops in ROI mode, or
+    full-resolution tiles in tiled mode, where frames is (full frames, working frames)."""
+    imgsz = scheduler.imgsz if scheduler is not None else None
+    if tiled_inference:
+        full_frames, working_frames = frames
+        return predict_tiles(model, full_frames, tile_spans, output_frames=working_frames, imgsz=imgsz)
+    if roi_spans is not None:
+        return predict_rois(model, frames, roi_spans, batched=batch_inference, imgsz=imgsz)
+    return predict_pair(model, frames[0], frames[1], batched=batch_inference, imgsz=imgsz)
+
+
+def infer_pair(pair):
+    """Inference stage: run the detector on a matched stereo pair."""
+    frame1, frame2, skew, stamp = pair
+    source = None
+    if tiled_inference:
+        # Everything after detection works at the usual working size
+        full_frames = (frame1, frame2)
+        frame1, frame2 = (cv2.resize(f, (FRAME_WIDTH, FRAME_HEIGHT), interpolation=cv2.INTER_AREA)
+                          for f in full_frames)
+        source = (full_frames, (frame1, frame2))
+    if motion_gate is not None and motion_gate.check((frame1, frame2), tracks_active=bool(id_memory)) is None:
+        if keyframes is not None:
+            keyframes.invalidate()
+        return Detections.empty(frame1), Detections.empty(frame2)
+    if keyframes is not None:
+        results1, results2 = keyframes((frame1, frame2), force=approaching_zone, source=source)
+    else:
+        results1, results2 = detect_frames(source or (frame1, frame2))
+
+    if scheduler is not None:
+        # Capture-to-detection latency plus the pairs queued on either side of this stage
+        backlog = pairer.backlog() + (detections_queue.qsize() if pipelined else 0)
+        scheduler.update(time.monotonic() - stamp, backlog, force_full=approaching_zone)
+    return results1, results2
+
+
+def process_pair(detections):
+    """Post-process stage: match people across cameras, estimate distance, check zones, raise alarms."""
+    global next_id, id_memory, text_alert_sent, last_alert_time, approaching_zone
+
+    results1, results2 = detections
+    matched1, matched2 = match_persons(results1, results2, confidence_threshold=0.5,
+                                       max_row_offset=max_row_offset, max_disparity=max_disparity,
+                                       calibration=calibration, disparity_sign=disparity_sign)
+
+    # Per-pair geometry for every match at once; rows are [x1, y1, x2, y2, conf]
+    heights1 = matched1[:, 3] - matched1[:, 1]
+    heights2 = matched2[:, 3] - matched2[:, 1]
+    centers1_x = (matched1[:, 0] + matched1[:, 2]) / 2
+    centers1_y = (matched1[:, 1] + matched1[:, 3]) / 2
+
+    # Disparity from rectified box corners when calibrated (raw pixels otherwise)
+    if calibration is not None:
+        disp1 = calibration.rectify_boxes(matched1, 0)
+        disp2 = calibration.rectify_boxes(matched2, 1)
+    else:
+        disp1, disp2 = matched1, matched2
+    pair_disparities = box_disparities(disp1, disp2)
+    valid = ((matched1[:, 4] >= 0.5) & (matched2[:, 4] >= 0.5) &
+             (np.abs(heights1 - heights2) <= 50))
+
+    # Calibrated sites triangulate every pair in one call; otherwise fall back to the tuned heuristics
+    world_points = None
+    if calibration is not None:
+        world_points = triangulate_pairs(disp1, disp2, calibration)
+        valid &= world_points[:, 1] > 0  # Mismatched pairs can land behind the cameras
+
+    intrusion_detected = False
+    blue_zone_intrusion = False
+    distances = []
+    disparities = []
+    people = []  # (box1, center_x, center_y, distance, assigned_id, zone_label, zone_color, velocity, sigma)
+    new_id_memory = {}
+    current_time = time.time()
+
+    # Persistent IDs: one global assignment against the live tracks, 60 px center / 30 px height gate
+    valid_index = np.flatnonzero(valid)
+    live_ids = [pid for pid in id_memory if current_time - id_timestamps.get(pid, 0) <= id_timeout]
+    previous = np.array([id_memory[pid] for pid in live_ids], dtype=np.float64).reshape(-1, 3)
+    centers = np.column_stack([centers1_x[valid_index], centers1_y[valid_index]]).astype(int)
+    matches = associate(previous[:, :2], centers, gate=60,
+                        track_sizes=previous[:, 2], sizes=heights1[valid_index], size_gate=30)
+    matched_ids = {int(n): live_ids[t] for n, t in matches}
+
+    # First pass: disparity history; collect people ready for a distance
+    ready = []  # (index, assigned_id, smoothed_disparity)
+    for n, i in enumerate(valid_index):
+        height1 = float(heights1[i])
+        center_x = int(centers1_x[i])
+        center_y = int(centers1_y[i])
+
+        assigned_id = matched_ids.get(n)
+        if assigned_id is None:
+            assigned_id = next_id
+            next_id += 1
+
+        new_id_memory[assigned_id] = (center_x, center_y, height1)
+        id_timestamps[assigned_id] = current_time
+
+        disparity = float(pair_disparities[i])
+
+        disparity_history.push(assigned_id, disparity, current_time)
+        if disparity_history.size(assigned_id) < 3:
+            continue
+
+        ready.append((i, assigned_id, disparity_history.median(assigned_id)))
+
+    # Raw distance and lateral factor for everyone at once
+    index = np.array([i for i, _, _ in ready], dtype=np.intp)
+    if world_points is not None:
+        raw_distances = world_points[index, 1]
+        lateral = world_points[index, 0] / world_points[index, 1]  # Triangulated bearing
+    else:
+        raw_distances = estimate_distances(distance_tables, [d for _, _, d in ready], heights1[index],
+                                           distance_model["stereo_weight"])
+        lateral = distance_tables.bearings(centers1_x[index])
+
+    if world_points is None:
+        raw_distances = raw_distances * distance_model["scale_factor"]
+    finite = np.isfinite(raw_distances)  # Zero-height box with no disparity
+    ready = [r for r, ok in zip(ready, finite) if ok]
+    raw_distances, lateral = raw_distances[finite], lateral[finite]
+
+    # Temporal smoothing: one batched Kalman predict/update over every tracked person
+    track_ids = [assigned_id for _, assigned_id, _ in ready]
+    measurements = np.column_stack([lateral * raw_distances, raw_distances])
+    positions, velocities, sigmas = world_tracker.step(track_ids, measurements, current_time)
+    world_tracker.prune(current_time, id_timeout)
+    approaching_zone = near_any_zone(positions, velocities, zone_guard_ft)
+
+    # Second pass: zones and alarms on the smoothed positions
+    for (i, assigned_id, smoothed_disparity), point_world, velocity, sigma in zip(
+            ready, positions, velocities, sigmas):
+        box1 = matched1[i]
+        center_x = int(centers1_x[i])
+        center_y = int(centers1_y[i])
+        distance = float(point_world[1])
+        distances.append(distance)
+        disparities.append(smoothed_disparity)
+
+        # Zone checks
+        zone_label = "None"
+        zone_color = (200, 200, 200)
+
+        if is_point_in_zone(point_world, zones["red"]):
+            zone_label = "Red Zone"
+            zone_color = (0, 0, 255)
+            intrusion_detected = True
+            sock.send(b"Alarm")
+
+        elif is_point_in_zone(point_world, zones["blue"]):
+            zone_label = "Blue Zone"
+            zone_color = (255, 0, 0)
+            blue_zone_intrusion = True
+
+        people.append((box1, center_x, center_y, distance, assigned_id, zone_label, zone_color,
+                       velocity, float(sigma)))
+
+    # After loop: turn off alarm if no red zone intrusion
+    if not intrusion_detected:
+        sock.send(b"Stop")
+
+    # Cleanup expired IDs
+    id_memory = new_id_memory
+    expired_ids = [pid for pid, t in id_timestamps.items() if current_time - t > id_timeout]
+    for eid in expired_ids:
+        id_timestamps.pop(eid, None)
+    disparity_history.evict(current_time)
+
+    # Text/email alert for blue zone
+    if blue_zone_intrusion and not text_alert_sent and (time.time() - last_alert_time) > cooldown_duration:
+        threading.Thread(target=send_text_alert).start()
+        text_alert_sent = True
+        last_alert_time = time.time()
+    elif not blue_zone_intrusion:
+        text_alert_sent = False
+
+    return results1, results2, people, distances, disparities, intrusion_detected
+
+
+def render_frame(processed):
+    """Render stage: draw overlays, then record and display the combined frame."""
+    results1, results2, people, distances, disparities, intrusion_detected = processed
+
+    frame1_resized = results1.plot()
+    frame2_resized = results2.plot()
+
+    for box1, center_x, center_y, distance, assigned_id, zone_label, zone_color, velocity, sigma in people:
+        cv2.putText(frame1_resized, f"{distance:.2f} ft +/-{sigma:.1f}", (center_x, center_y - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        cv2.circle(frame1_resized, (center_x, center_y), 5, (255, 0, 0), -1)
+        cv2.rectangle(frame1_resized, (int(box1[0]), int(box1[1])), (int(box1[2]), int(box1[3])), (0, 255, 0), 2)
+        cv2.putText(frame1_resized, f"ID {assigned_id}", (center_x, center_y + 45),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, (100, 255, 255), 1)
+        cv2.putText(frame1_resized, f"{zone_label}", (center_x, center_y + 65),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, zone_color, 1)
+
+    # Final output
+    combined_height = FRAME_HEIGHT + 300
+    combined_frame = np.zeros((combined_height, FRAME_WIDTH * 2, 3), dtype=np.uint8)
+    combined_frame[:FRAME_HEIGHT, :FRAME_WIDTH] = frame1_resized
+    combined_frame[:FRAME_HEIGHT, FRAME_WIDTH:] = frame2_resized
+
+    for i, dist in enumerate(distances):
+        cv2.putText(combined_frame, f"Person {i+1}: {dist:.2f} ft", (10, 30 + i * 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+    for i, disp in enumerate(disparities):
+        cv2.putText(combined_frame, f"Disparity {i+1}: {disp:.2f} px", (10, FRAME_HEIGHT + 30 + i * 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+    if intrusion_detected:
+        cv2.putText(combined_frame, "Intrusion Detected!", (10, FRAME_HEIGHT + 60),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+
+    frame = cv2.resize(combined_frame, (1280, 720))
+
+    if recording and video_writer:
+        video_writer.write(frame)
+
+    cv2.imshow("Combined Frame", frame)
+
+
+
+if __name__ == "__main__":
+    print("finalCamera has start!")
+    if calibration is not None:
+        print(f"[CALIB] Loaded {calibration_file}: focal {focal_length:.1f} px, baseline {baseline_in:.2f} in")
+    else:
+        print(f"[CALIB] No {calibration_file}, using default focal length and baseline")
+        print(f"[CALIB] Distance correction version {distance_model['version']}")
+
+    # -------------------------------
+    # Serial Communication with Arduinos
+    # -------------------------------
+    arduino_port = "COM6" #change depending on device (COM3 or 6)
+    baud_rate = 9600
+
+    try:
+        arduino = serial.Serial(arduino_port, baud_rate, timeout=1)
+        print(f"Connected to Arduino on {arduino_port}")
+    except Exception as e:
+        print(f"Error connecting to Arduino: {e}")
+        arduino = None
+
+    sock = PersistentSocketClient("10.0.0.2", 10000)
+
+    threading.Thread(target=command_listener, daemon=True).start()
+
+    # Video file paths
+    # stream_url_1 = "http://192.168.1.134:8080"
+    # stream_url_2 = "http://192.168.1.107:8080"
+    stream_url_1 = camera1
+    stream_url_2 = camera2
+
+    # Load person detector
+    model = load_detector(inference_backend, model_path)
+    if cascade:
+        screen = load_detector(inference_backend, cascade_screen_model or model_path, imgsz=cascade_screen_imgsz)
+        model = CascadeDetector(screen, model, cascade_screen_confidence, cascade_audit_interval)
+
+    if roi_spans is not None and (model.fixed_size or model.square_input):
+        print(f"[ROI] {model.name} backend letterboxes to a square input, running whole frames instead of crops")
+
+    scheduler = None
+    if adaptive_resolution:
+        if model.fixed_size:
+            print("[RESOLUTION] Static-shape model, adaptive resolution disabled")
+        else:
+            scheduler = ResolutionScheduler(min_imgsz, min(max_imgsz, model.imgsz),
+                                            latency_high=resolution_latency_high,
+                                            latency_low=resolution_latency_low)
+    keyframes = KeyframeDetector(detect_frames, keyframe_interval) if keyframe_interval > 1 else None
+
+    # Tiled inference needs the cameras' full resolution; everything else works at FRAME_WIDTH x FRAME_HEIGHT
+    capture_size = tile_capture_size if tiled_inference else (FRAME_WIDTH, FRAME_HEIGHT)
+
+    if capture_mode == "process":
+        # Decode each stream in its own process, sharing frames through shared memory
+        cap1 = CaptureProcess(stream_url_1, pairer, 1, camera1_backend, reconnect, size=capture_size)
+        cap2 = CaptureProcess(stream_url_2, pairer, 2, camera2_backend, reconnect, size=capture_size)
+        cap1.start()
+        cap2.start()
+        print("Capture running in separate processes")
+    else:
+        # Video Initialization
+        if reconnect:
+            cap1 = ResilientCapture(stream_url_1, camera1_backend, 1, size=capture_size)
+            cap2 = ResilientCapture(stream_url_2, camera2_backend, 2, size=capture_size)
+        else:
+            cap1 = open_capture(stream_url_1, camera1_backend, 1, size=capture_size)
+            cap2 = open_capture(stream_url_2, camera2_backend, 2, size=capture_size)
+
+        if not cap1.isOpened() or not cap2.isOpened():
+            print("Error: Could not open video files.")
+            exit()
+
+        # Get FPS from video files
+        fps1 = cap1.get(cv2.CAP_PROP_FPS)
+        fps2 = cap2.get(cv2.CAP_PROP_FPS)
+        fps = min(fps1, fps2)  # Use the lower FPS to prevent desync
+        print(f"Video 1 FPS: {fps1}")
+        print(f"Video 2 FPS: {fps2}")
+        print(f"Using FPS: {fps}")
+
+        # Start frame capture threads
+        thread1 = threading.Thread(target=capture_frames, args=(cap1, pairer, 1, fps, capture_size))
+        thread2 = threading.Thread(target=capture_frames, args=(cap2, pairer, 2, fps, capture_size))
+        thread1.start()
+        thread2.start()
+
+    # Display Loop with Combined Frames, Distance, and Disparity
+    if pipelined:
+        # Inference and post-processing overlap on worker threads; rendering stays on the
+        # main thread because HighGUI windows must be driven from there
+        detections_queue = StageQueue()
+        render_queue = StageQueue()
+        infer_stage = Stage("infer", infer_pair, lambda timeout: pairer.wait_pair(timeout),
+                            detections_queue, depth=pairer.depth)
+        post_stage = Stage("post", process_pair, detections_queue.next_item,
+                           render_queue, depth=detections_queue.depth)
+        render_stage = Stage("render", render_frame, render_queue.next_item, depth=render_queue.depth)
+        infer_stage.start()
+        post_stage.start()
+
+    faulted = None
+    while True:
+        if pipelined:
+            faulted = next((stage for stage in (infer_stage, post_stage) if stage.fault is not None), None)
+            if faulted is not None:
+                # Detection or alarm logic is no longer running; alarm the GUI rather than go quiet
                 sock.send(b"Alarm")
+                break
+            processed = render_queue.next_item(timeout=PAIR_WAIT_TIMEOUT)
+            if processed is not None:
+                render_stage.process(processed)
+        else:
+            # Block until both cameras have a matching frame; the timeout only keeps the window responsive
+            pair = pairer.wait_pair(timeout=PAIR_WAIT_TIMEOUT)
+            processed = pair
+            if pair is not None:
+                render_frame(process_pair(infer_pair(pair)))
+
+        if processed is not None:
+            frame_counter += 1
+            if time.time() - fps_timer >= 1.0:
+                print(f"[FPS] {frame_counter} frames/sec")
+                print(pairer.report())
+                if pipelined:
+                    print(f"[PIPE] {infer_stage.report()} | {post_stage.report()} | {render_stage.report()}")
+                if capture_mode == "process":
+                    print(f"[RING] lapped={cap1.ring.lapped}/{cap2.ring.lapped}")
+                if reconnect:
+                    print(f"[CAPTURE] {cap1.status.summary()} | {cap2.status.summary()}")
+                print(disparity_history.report())
+                if motion_gate is not None:
+                    print(motion_gate.report())
+                if keyframes is not None:
+                    print(keyframes.report())
+                if cascade:
+                    print(model.report())
+                if scheduler is not None:
+                    print(f"[RESOLUTION] imgsz {scheduler.imgsz}, latency {scheduler.latency * 1000:.0f} ms")
+                frame_counter = 0
+                fps_timer = time.time()
+
+        key = cv2.waitKey(1)
+        if key & 0xFF == ord('q'):
+            break
 
-            elif is_point_in_zone(point_world, zones["blue"]):
-                zone_label = "Blue Zone"
-                zone_color = (255, 0, 0)
-                blue_zone_intrusion = True
-
-            # Drawing
-            cv2.putText(frame1_resized, f"{distance:.2f} ft", (center_x, center_y - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            cv2.circle(frame1_resized, (center_x, center_y), 5, (255, 0, 0), -1)
-            cv2.rectangle(frame1_resized, (int(box1[0]), int(box1[1])), (int(box1[2]), int(box1[3])), (0, 255, 0), 2)
-            cv2.putText(frame1_resized, f"ID {assigned_id}", (center_x, center_y + 45),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.45, (100, 255, 255), 1)
-            cv2.putText(frame1_resized, f"{zone_label}", (center_x, center_y + 65),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.45, zone_color, 1)
-
-        # After loop: turn off alarm if no red zone intrusion
-        if not intrusion_detected:
-            sock.send(b"Stop")
-
-        # Cleanup expired IDs
-        id_memory = new_id_memory
-        expired_ids = [pid for pid, t in id_timestamps.items() if current_time - t > id_timeout]
-        for eid in expired_ids:
-            id_timestamps.pop(eid, None)
-
-        # Text/email alert for blue zone
-        if blue_zone_intrusion and not text_alert_sent and (time.time() - last_alert_time) > cooldown_duration:
-            threading.Thread(target=send_text_alert).start()
-            text_alert_sent = True
-            last_alert_time = time.time()
-        elif not blue_zone_intrusion:
-            text_alert_sent = False
-
-        # Final output
-        combined_height = FRAME_HEIGHT + 300
-        combined_frame = np.zeros((combined_height, FRAME_WIDTH * 2, 3), dtype=np.uint8)
-        combined_frame[:FRAME_HEIGHT, :FRAME_WIDTH] = frame1_resized
-        combined_frame[:FRAME_HEIGHT, FRAME_WIDTH:] = frame2_resized
-
-        for i, dist in enumerate(distances):
-            cv2.putText(combined_frame, f"Person {i+1}: {dist:.2f} ft", (10, 30 + i * 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-        for i, disp in enumerate(disparities):
-            cv2.putText(combined_frame, f"Disparity {i+1}: {disp:.2f} px", (10, FRAME_HEIGHT + 30 + i * 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-
-        if intrusion_detected:
-            cv2.putText(combined_frame, "Intrusion Detected!", (10, FRAME_HEIGHT + 60),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
-
-        frame = cv2.resize(combined_frame, (1280, 720))
-
-        if recording and video_writer:
-            video_writer.write(frame)
-
-        cv2.imshow("Combined Frame", frame)
-        
-        frame_counter += 1
-        if time.time() - fps_timer >= 1.0:
-            print(f"[FPS] {frame_counter} frames/sec")
-            frame_counter = 0
-            fps_timer = time.time()
-
-    key = cv2.waitKey(1)
-    if key & 0xFF == ord('q'):
-        break
-
-cap1.release()
-cap2.release()
-cv2.destroyAllWindows()
+    cap1.release()
+    cap2.release()
+    cv2.destroyAllWindows()
+    if faulted is not None:
+        raise RuntimeError(f"{faulted.name} stage stopped after repeated failures") from faulted.fault
@@ -0,0 +1,146 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool, cpu_count
+
+import cv2
+import numpy as np
+
+from capture import FRAME_WIDTH, FRAME_HEIGHT
+from detector import load_detector, predict_pair
+from stereo import (BASELINE_IN, DISTANCE_CALIBRATION_FILE, FOCAL_LENGTH, PIXEL_HEIGHT_CONSTANT,
+                    box_disparities, load_distance_model, match_persons)
+
+
+# -------------------------------
+# Offline Distance Correction Fitter
+# -------------------------------
+# Ground truth file: {"clips": [{"left": "...", "right": "...", "distance_ft": 15}, ...]},
+# one person standing at a known distance per clip.
+TRUTH_FILE = "distance_truth.json"
+STEREO_WEIGHTS = np.linspace(0.0, 1.0, 21)
+SCALE_FACTORS = np.linspace(0.5, 3.0, 51)
+RIDGE = 1e-3  # Pulls knot values toward the current model where the clips say little
+
+detector = None
+
+
+def init_worker(backend, model_path):
+    global detector
+    detector = load_detector(backend, model_path)
+
+
+def clip_samples(clip):
+    """Run detection and matching over one clip; returns (disparity, height, truth) rows."""
+    cap1 = cv2.VideoCapture(clip["left"])
+    cap2 = cv2.VideoCapture(clip["right"])
+    samples = []
+    while True:
+        ret1, frame1 = cap1.read()
+        ret2, frame2 = cap2.read()
+        if not ret1 or not ret2:
+            break
+        frame1 = cv2.resize(frame1, (FRAME_WIDTH, FRAME_HEIGHT))
+        frame2 = cv2.resize(frame2, (FRAME_WIDTH, FRAME_HEIGHT))
+        results1, results2 = predict_pair(detector, frame1, frame2)
+        matched1, matched2 = match_persons(results1, results2, confidence_threshold=0.5)
+        if len(matched1) == 0:
+            continue
+        # The subject is the most confident match in both views
+        best = np.argmax(np.minimum(matched1[:, 4], matched2[:, 4]))
+        disparity = box_disparities(matched1[best:best + 1], matched2[best:best + 1])[0]
+        height = matched1[best, 3] - matched1[best, 1]
+        if disparity > 0 and height > 0:
+            samples.append((disparity, height, clip["distance_ft"]))
+    cap1.release()
+    cap2.release()
+    print(f"[FIT] {os.path.basename(clip['left'])}: {len(samples)} samples at {clip['distance_ft']} ft")
+    return samples
+
+
+def design(samples, input_points, focal_length, baseline_in):
+    """Per-sample terms that make the distance model linear in the knot scales and offsets."""
+    disparity, height, truth = samples.T
+    raw = focal_length * baseline_in * 0.0254 / disparity
+    # weights[:, k] is how much knot k contributes to np.interp at each raw distance
+    weights = np.stack([np.interp(raw, input_points, np.eye(len(input_points))[k])
+                        for k in range(len(input_points))], axis=1)
+    fudge = np.where(height < 100, 0.9, np.where(height > 250, 1.05, 1.0))
+    pixel = PIXEL_HEIGHT_CONSTANT / height
+    return raw, weights, fudge, pixel, truth
+
+
+def fit_point(task):
+    """Best knot values for one (stereo_weight, scale_factor) grid point by ridge least squares."""
+    (stereo_weight, scale_factor), (raw, weights, fudge, pixel, truth), current = task
+    gain = (scale_factor * fudge * stereo_weight)[:, None]
+    X = np.hstack([gain * raw[:, None] * weights, gain * weights])
+    target = truth - scale_factor * fudge * (1 - stereo_weight) * pixel
+    lam = RIDGE * len(truth)
+    params = np.linalg.solve(X.T @ X + lam * np.eye(X.shape[1]), X.T @ target + lam * current)
+    rmse = float(np.sqrt(np.mean((X @ params - target) ** 2)))
+    return rmse, stereo_weight, scale_factor, params
+
+
+def model_rmse(model, terms):
+    raw, weights, fudge, pixel, truth = terms
+    corrected = raw * (weights @ model["scale_factors"]) + weights @ model["offsets"]
+    blended = model["stereo_weight"] * corrected + (1 - model["stereo_weight"]) * pixel
+    predicted = model["scale_factor"] * fudge * blended
+    return float(np.sqrt(np.mean((predicted - truth) ** 2)))
+
+
+def main(args):
+    with open(args.truth, "r") as f:
+        clips = json.load(f)["clips"]
+    current = load_distance_model(args.output)
+    input_points = np.asarray(current["input_points"], dtype=np.float64)
+
+    start = time.time()
+    with Pool(args.workers, initializer=init_worker, initargs=(args.backend, args.model)) as pool:
+        samples = np.array([s for clip in pool.map(clip_samples, clips) for s in clip], dtype=np.float64)
+        if len(samples) < 2 * len(input_points):
+            raise SystemExit(f"[FIT] Only {len(samples)} samples, record more clips")
+        print(f"[FIT] {len(samples)} samples from {len(clips)} clips in {time.time() - start:.0f}s")
+
+        terms = design(samples, input_points, args.focal_length, args.baseline)
+        current_params = np.concatenate([current["scale_factors"], current["offsets"]])
+        grid = [(point, terms, current_params) for point in itertools.product(STEREO_WEIGHTS, SCALE_FACTORS)]
+        chunks = max(1, len(grid) // (args.workers * 4))
+        rmse, stereo_weight, scale_factor, params = min(pool.map(fit_point, grid, chunksize=chunks),
+                                                        key=lambda r: r[0])
+
+    before = model_rmse(current, terms)
+    k = len(input_points)
+    model = {
+        "version": int(current.get("version", 0)) + 1,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "input_points": input_points.tolist(),
+        "scale_factors": np.round(params[:k], 4).tolist(),
+        "offsets": np.round(params[k:], 4).tolist(),
+        "stereo_weight": round(float(stereo_weight), 4),
+        "scale_factor": round(float(scale_factor), 4),
+        "rmse_ft": round(rmse, 3),
+        "samples": len(samples),
+        "clips": [os.path.basename(c["left"]) for c in clips],
+    }
+    print(f"[FIT] RMSE {before:.2f} ft -> {rmse:.2f} ft "
+          f"(stereo weight {stereo_weight:.2f}, scale {scale_factor:.2f})")
+
+    with open(args.output, "w") as f:
+        json.dump(model, f, indent=4)
+    print(f"[FIT] Saved version {model['version']} to {args.output} in {time.time() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the uncalibrated distance correction to ground truth clips")
+    parser.add_argument("--truth", default=TRUTH_FILE)
+    parser.add_argument("--output", default=DISTANCE_CALIBRATION_FILE)
+    parser.add_argument("--backend", default="ultralytics")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--focal-length", type=float, default=FOCAL_LENGTH)
+    parser.add_argument("--baseline", type=float, default=BASELINE_IN, help="Camera baseline in inches")
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    main(parser.parse_args())
@@ -0,0 +1,210 @@
+import time
+
+import cv2
+import numpy as np
+
+from detector import Detections
+
+
+# -------------------------------
+# Motion-Gated Inference
+# -------------------------------
+MOTION_SCALE = 0.25        # Background subtraction runs on a quarter-size grayscale frame
+MOTION_MIN_AREA = 400      # Smallest moving blob worth a detection, in full-frame pixels
+MOTION_HISTORY = 100       # Same subtractor settings as MotionDetection.py
+MOTION_VAR_THRESHOLD = 16
+KEEPALIVE_INTERVAL = 2.0   # Seconds; detect at least this often so a stationary intruder is not missed
+
+
+class MotionGate:
+    """Decides, per stereo pair, whether the person detector needs to run.
+
+    Each camera feeds a downscaled MOG2 background subtractor. The detector runs
+    when either camera shows a moving blob, while any track is still active, or
+    when keepalive seconds have passed since the last inference.
+    """
+
+    def __init__(self, cameras=2, scale=MOTION_SCALE, min_area=MOTION_MIN_AREA, keepalive=KEEPALIVE_INTERVAL):
+        self.scale = scale
+        self.min_area = min_area * scale * scale  # Compare in downscaled pixels
+        self.keepalive = keepalive
+        self.subtractors = [cv2.createBackgroundSubtractorMOG2(history=MOTION_HISTORY,
+                                                               varThreshold=MOTION_VAR_THRESHOLD,
+                                                               detectShadows=False)
+                            for _ in range(cameras)]
+        self.kernel = np.ones((3, 3), np.uint8)
+        self.last_inference = 0.0
+
+        # Stats, reset by report()
+        self.checked = 0
+        self.reasons = {"motion": 0, "tracks": 0, "keepalive": 0}
+
+    def moving(self, frame, camera):
+        """Update camera's background model and report whether anything large enough moved."""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        mask = self.subtractors[camera].apply(gray)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)  # Drop single-pixel sensor noise
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return any(cv2.contourArea(cnt) >= self.min_area for cnt in contours)
+
+    def check(self, frames, tracks_active, now=None):
+        """Return why the detector should run on these frames ("motion", "tracks", "keepalive") or None."""
+        now = time.monotonic() if now is None else now
+        self.checked += 1
+        # Every camera's model is updated each frame, so no short-circuit here
+        motion = [self.moving(frame, camera) for camera, frame in enumerate(frames)]
+        if any(motion):
+            reason = "motion"
+        elif tracks_active:
+            reason = "tracks"
+        elif now - self.last_inference >= self.keepalive:
+            reason = "keepalive"
+        else:
+            return None
+        self.reasons[reason] += 1
+        self.last_inference = now
+        return reason
+
+    def report(self):
+        """Return how many pairs went to the detector since the last report and reset the counts."""
+        detected = sum(self.reasons.values())
+        reasons = ", ".join(f"{name} {count}" for name, count in self.reasons.items())
+        line = f"[GATE] detected {detected}/{self.checked} ({reasons})"
+        self.checked = 0
+        self.reasons = dict.fromkeys(self.reasons, 0)
+        return line
+
+
+# -------------------------------
+# Keyframe Detection with Optical-Flow Propagation
+# -------------------------------
+KEYFRAME_INTERVAL = 1          # Detect every N pairs; 1 keeps full-rate detection
+FLOW_CORNERS_PER_BOX = 20
+FLOW_MIN_POINTS = 5            # Surviving corners a box needs for a trustworthy shift
+FLOW_MIN_GOOD_FRACTION = 0.5   # Share of a box's corners that must survive
+FLOW_MAX_FB_ERROR = 1.0        # Pixels; forward-backward disagreement above this marks a corner lost
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class BoxPropagator:
+    """Carries one camera's detections between keyframes along sparse Lucas-Kanade flow.
+
+    Corners are seeded inside each box on a keyframe. Every later frame tracks them
+    forward and back in one LK call per direction, and each box moves by the median
+    shift of its surviving corners.
+    """
+
+    def __init__(self):
+        self.gray = None
+        self.detections = None
+        self.points = np.empty((0, 1, 2), dtype=np.float32)
+        self.owner = np.empty(0, dtype=np.intp)  # Box index of each point
+
+    def reset(self, frame, detections):
+        """Start propagating from a freshly detected frame."""
+        self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.detections = detections
+        points, owner = [], []
+        height, width = self.gray.shape
+        for index, (x1, y1, x2, y2) in enumerate(detections.xyxy.astype(int)):
+            x1, y1 = max(x1, 0), max(y1, 0)
+            x2, y2 = min(x2, width), min(y2, height)
+            if x2 - x1 < 3 or y2 - y1 < 3:
+                continue
+            corners = cv2.goodFeaturesToTrack(self.gray[y1:y2, x1:x2], FLOW_CORNERS_PER_BOX, 0.01, 3)
+            if corners is None:
+                continue
+            points.append(corners + np.array([x1, y1], dtype=np.float32))
+            owner.append(np.full(len(corners), index, dtype=np.intp))
+        self.points = np.concatenate(points) if points else np.empty((0, 1, 2), dtype=np.float32)
+        self.owner = np.concatenate(owner) if owner else np.empty(0, dtype=np.intp)
+
+    def invalidate(self):
+        self.detections = None
+
+    def propagate(self, frame):
+        """Move the stored boxes onto frame. Returns Detections, or None when flow cannot be trusted."""
+        if self.detections is None:
+            return None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        boxes = len(self.detections)
+        if boxes == 0:
+            self.gray = gray
+            return Detections.empty(frame, self.detections.names)
+        if len(self.points) == 0:
+            return None
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.gray, gray, self.points, None, **LK_PARAMS)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.gray, moved, None, **LK_PARAMS)
+        fb_error = np.linalg.norm((self.points - back).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < FLOW_MAX_FB_ERROR)
+
+        seeded = np.bincount(self.owner, minlength=boxes)
+        surviving = np.bincount(self.owner[good], minlength=boxes)
+        if np.any(surviving < FLOW_MIN_POINTS) or np.any(surviving < FLOW_MIN_GOOD_FRACTION * seeded):
+            return None
+
+        shifts = (moved - self.points).reshape(-1, 2)[good]
+        owner = self.owner[good]
+        offset = np.array([np.median(shifts[owner == index], axis=0) for index in range(boxes)])
+        xyxy = self.detections.xyxy + np.hstack([offset, offset]).astype(self.detections.xyxy.dtype)
+        height, width = gray.shape
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+
+        self.detections = Detections(xyxy, self.detections.conf, self.detections.cls, frame, self.detections.names)
+        self.gray = gray
+        self.points, self.owner = moved[good], owner
+        return self.detections
+
+
+class KeyframeDetector:
+    """Runs detect on every interval-th stereo pair and propagates boxes with flow in between.
+
+    A pair is detected early when flow fails in either camera or the caller forces
+    it, e.g. because a tracked person is close to a zone.
+    """
+
+    def __init__(self, detect, interval=KEYFRAME_INTERVAL, cameras=2):
+        self.detect = detect  # Callable(source frames) -> list of Detections
+        self.interval = interval
+        self.propagators = [BoxPropagator() for _ in range(cameras)]
+        self.since_keyframe = interval
+
+        # Stats, reset by report()
+        self.counts = {"keyframe": 0, "propagated": 0, "flow": 0, "forced": 0}
+
+    def __call__(self, frames, force=False, source=None):
+        """Detections for frames; detect is given source instead when set (e.g. full-resolution frames)."""
+        self.since_keyframe += 1
+        if self.since_keyframe < self.interval:
+            if force:
+                self.counts["forced"] += 1
+            else:
+                propagated = [p.propagate(frame) for p, frame in zip(self.propagators, frames)]
+                if all(d is not None for d in propagated):
+                    self.counts["propagated"] += 1
+                    return propagated
+                self.counts["flow"] += 1
+        else:
+            self.counts["keyframe"] += 1
+
+        detections = self.detect(frames if source is None else source)
+        for propagator, frame, frame_detections in zip(self.propagators, frames, detections):
+            propagator.reset(frame, frame_detections)
+        self.since_keyframe = 0
+        return detections
+
+    def invalidate(self):
+        """Make the next pair a keyframe, e.g. after pairs the detector never saw."""
+        for propagator in self.propagators:
+            propagator.invalidate()
+        self.since_keyframe = self.interval
+
+    def report(self):
+        """Return how each pair was handled since the last report and reset the counts."""
+        line = "[FLOW] " + ", ".join(f"{name} {count}" for name, count in self.counts.items())
+        self.counts = dict.fromkeys(self.counts, 0)
+        return line
@@ -0,0 +1,170 @@
+import threading
+import time
+import traceback
+from queue import Queue, Empty
+
+
+# -------------------------------
+# Staged Pipeline with Bounded Queues
+# -------------------------------
+STAGE_QUEUE_SIZE = 2       # Small queues keep latency low; a full queue stalls the stage before it
+STAGE_POLL_TIMEOUT = 0.1
+STAGE_MAX_ERRORS = 5       # Consecutive failed items before a stage gives up and reports a fault
+
+
+class StageQueue(Queue):
+    """Bounded queue between two stages."""
+
+    def __init__(self, maxsize=STAGE_QUEUE_SIZE):
+        super().__init__(maxsize=maxsize)
+
+    def next_item(self, timeout=None):
+        """Return the next item, or None if nothing arrives within timeout."""
+        try:
+            return self.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def depth(self):
+        return f"{self.qsize()}/{self.maxsize}"
+
+
+class Stage:
+    """One pipeline step: pulls from source, applies fn and hands the result to outbox.
+
+    start() runs it on its own worker thread, which logs and skips items that raise.
+    After max_errors failures in a row the thread stops and sets fault, which the
+    owner must check. process() can also be called directly, e.g. for a stage that
+    must stay on the main thread.
+    """
+
+    def __init__(self, name, fn, source, outbox=None, depth=None, max_errors=STAGE_MAX_ERRORS):
+        self.name = name
+        self.fn = fn
+        self.source = source  # Callable(timeout) -> item or None
+        self.outbox = outbox
+        self.depth = depth    # Callable returning the input queue depth, for stats
+        self.max_errors = max_errors
+        self.fault = None     # Last exception once the worker has given up
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+        # Stats, reset by report()
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.timer = time.monotonic()
+
+    def start(self):
+        self.thread.start()
+
+    def process(self, item):
+        start = time.perf_counter()
+        result = self.fn(item)
+        self.busy += time.perf_counter() - start
+        self.processed += 1
+        return result
+
+    def run(self):
+        failures = 0
+        while True:
+            item = self.source(STAGE_POLL_TIMEOUT)
+            if item is None:
+                continue
+            # One bad item must not kill the worker thread, but a stage failing on
+            # every item is broken and must not keep running silently
+            try:
+                result = self.process(item)
+            except Exception as e:
+                self.errors += 1
+                failures += 1
+                traceback.print_exc()
+                if failures >= self.max_errors:
+                    print(f"[PIPE] {self.name} failed {failures} items in a row, stopping: {e}")
+                    self.fault = e
+                    return
+                print(f"[PIPE] {self.name} failed on an item, skipping it: {e}")
+                continue
+            failures = 0
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+    def report(self):
+        """Return throughput, busy share and input depth since the last report and reset them."""
+        now = time.monotonic()
+        elapsed = max(now - self.timer, 1e-6)
+        line = f"{self.name} {self.processed / elapsed:.1f}/s busy {self.busy / elapsed * 100:.0f}%"
+        if self.depth is not None:
+            line += f" queue {self.depth()}"
+        if self.errors:
+            line += f" errors {self.errors}"
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.timer = now
+        return line
+
+
+# -------------------------------
+# Adaptive Inference Resolution
+# -------------------------------
+RESOLUTION_STEP = 64            # Pixels per switch; keeps imgsz a multiple of the model stride
+RESOLUTION_LATENCY_HIGH = 0.25  # Seconds capture-to-detection; step down above this
+RESOLUTION_LATENCY_LOW = 0.12   # Step back up only below this, so the size does not flap
+RESOLUTION_BACKLOG = 2          # Pairs waiting in front of or behind inference that count as falling behind
+RESOLUTION_HOLD = 2.0           # Seconds to wait after a switch before judging its effect
+RESOLUTION_SMOOTHING = 0.2      # EMA weight of the newest latency sample
+
+
+class ResolutionScheduler:
+    """Steps the detector input size between min_imgsz and max_imgsz with the load.
+
+    Latency is smoothed, the up and down thresholds are apart, and no switch happens
+    within hold seconds of the last one. force_full jumps straight to max_imgsz, e.g.
+    while someone is in or heading into a zone. Every switch is printed with its cause.
+    """
+
+    def __init__(self, min_imgsz, max_imgsz, step=RESOLUTION_STEP, latency_high=RESOLUTION_LATENCY_HIGH,
+                 latency_low=RESOLUTION_LATENCY_LOW, backlog=RESOLUTION_BACKLOG, hold=RESOLUTION_HOLD):
+        self.min_imgsz = min_imgsz
+        self.max_imgsz = max_imgsz
+        self.step = step
+        self.latency_high = latency_high
+        self.latency_low = latency_low
+        self.backlog = backlog
+        self.hold = hold
+        self.imgsz = max_imgsz
+        self.latency = None
+        self.last_switch = 0.0
+        self.switches = 0
+
+    def update(self, latency, backlog, force_full=False, now=None):
+        """Feed one pair's latency (seconds) and the pairs waiting; returns the imgsz to use next."""
+        now = time.monotonic() if now is None else now
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += RESOLUTION_SMOOTHING * (latency - self.latency)
+
+        if force_full:
+            if self.imgsz < self.max_imgsz:
+                self._switch(self.max_imgsz, "person in or approaching a zone", now)
+            return self.imgsz
+        if now - self.last_switch < self.hold:
+            return self.imgsz
+
+        if self.imgsz > self.min_imgsz and (self.latency > self.latency_high or backlog >= self.backlog):
+            if self.latency > self.latency_high:
+                cause = f"latency {self.latency * 1000:.0f} ms > {self.latency_high * 1000:.0f} ms"
+            else:
+                cause = f"backlog {backlog} pairs"
+            self._switch(max(self.imgsz - self.step, self.min_imgsz), cause, now)
+        elif self.imgsz < self.max_imgsz and self.latency < self.latency_low and backlog == 0:
+            cause = f"latency {self.latency * 1000:.0f} ms < {self.latency_low * 1000:.0f} ms"
+            self._switch(min(self.imgsz + self.step, self.max_imgsz), cause, now)
+        return self.imgsz
+
+    def _switch(self, imgsz, cause, now):
+        print(f"[RESOLUTION] imgsz {self.imgsz} -> {imgsz}: {cause}")
+        self.imgsz = imgsz
+        self.last_switch = now
+        self.switches += 1
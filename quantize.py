@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+from capture import FRAME_WIDTH, FRAME_HEIGHT
+from detector import MODEL_IMGSZ, OnnxDetectorBase, OnnxRuntimeDetector
+
+
+# -------------------------------
+# INT8 Post-Training Quantization with Accuracy Gate
+# -------------------------------
+PERSON_CLASS = 0
+REPORT_PATH = "train11/weights/quantize_report.json"
+
+
+def sample_frames(videos, count):
+    """Evenly sample count frames across the recordings, resized to the working size."""
+    frames = []
+    per_video = max(1, count // len(videos))
+    for video in videos:
+        cap = cv2.VideoCapture(video)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or per_video
+        for index in np.linspace(0, total - 1, per_video).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT)))
+        cap.release()
+    print(f"[QUANT] Sampled {len(frames)} calibration frames from {', '.join(videos)}")
+    return frames
+
+
+class FrameCalibrationReader:
+    """onnxruntime CalibrationDataReader over letterboxed recording frames."""
+
+    def __init__(self, frames, input_name, imgsz=MODEL_IMGSZ):
+        prep = OnnxDetectorBase(None, imgsz)
+        # Letterbox lazily: all blobs at once would be ~1 GB at the default frame count
+        self.blobs = (prep.preprocess([frame])[0] for frame in frames)
+        self.input_name = input_name
+
+    def get_next(self):
+        blob = next(self.blobs, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+def head_decode_nodes(model_path):
+    """Names of the YOLOv8 box-decode ops in the detect head, which lose too much accuracy in INT8."""
+    import onnx
+
+    graph = onnx.load(model_path).graph
+    decode_ops = {"Concat", "Split", "Sigmoid", "Softmax", "Mul", "Add", "Sub", "Div", "Reshape", "Transpose"}
+    # Keep the head's conv branches (/cv2, /cv3) quantized, only the decode math stays FP32
+    return [n.name for n in graph.node
+            if "/model.22/" in n.name and n.op_type in decode_ops and "/cv" not in n.name]
+
+
+def export_fp32(weights, imgsz):
+    """Export the train11 PyTorch weights to ONNX next to them, once."""
+    onnx_path = os.path.splitext(weights)[0] + ".onnx"
+    if not os.path.exists(onnx_path):
+        from ultralytics import YOLO
+
+        YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    return onnx_path
+
+
+def quantize_int8(fp32_path, out_path, frames, imgsz):
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepped = fp32_path.replace(".onnx", "_prep.onnx")
+    quant_pre_process(fp32_path, prepped)
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(prepped, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    quantize_static(prepped, out_path, FrameCalibrationReader(frames, input_name, imgsz),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True,
+                    calibrate_method=CalibrationMethod.MinMax,
+                    nodes_to_exclude=head_decode_nodes(prepped))
+    os.remove(prepped)
+
+
+def person_map50(model_path, data, imgsz):
+    """Person-class mAP50 on the validation split of the train11 dataset."""
+    from ultralytics import YOLO
+
+    metrics = YOLO(model_path, task="detect").val(data=data, imgsz=imgsz, batch=1, plots=False, verbose=False)
+    classes = list(metrics.box.ap_class_index)
+    if PERSON_CLASS not in classes:
+        return 0.0
+    return float(metrics.box.class_result(classes.index(PERSON_CLASS))[2])
+
+
+def latency_ms(model_path, frames, imgsz, runs=50):
+    detector = OnnxRuntimeDetector(model_path, imgsz)
+    detector.predict([frames[0]])
+    start = time.perf_counter()
+    for i in range(runs):
+        detector.predict([frames[i % len(frames)]])
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main(args):
+    with open("ai_config.json", "r") as f:
+        config = json.load(f)
+    max_drop = args.max_drop if args.max_drop is not None else config.get("int8_max_map50_drop", 0.01)
+
+    fp32_path = export_fp32(args.weights, args.imgsz)
+    candidate = args.output.replace(".onnx", "_candidate.onnx")
+    frames = sample_frames(args.videos, args.calibration_frames)
+    quantize_int8(fp32_path, candidate, frames, args.imgsz)
+
+    report = {
+        "fp32": {"model": fp32_path,
+                 "latency_ms": latency_ms(fp32_path, frames, args.imgsz),
+                 "person_map50": person_map50(fp32_path, args.data, args.imgsz)},
+        "int8": {"model": args.output,
+                 "latency_ms": latency_ms(candidate, frames, args.imgsz),
+                 "person_map50": person_map50(candidate, args.data, args.imgsz)},
+        "max_map50_drop": max_drop,
+        "calibration_frames": len(frames),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    drop = report["fp32"]["person_map50"] - report["int8"]["person_map50"]
+    report["map50_drop"] = drop
+    report["published"] = drop <= max_drop
+
+    print(f"[QUANT] {'':6} {'latency':>12} {'person mAP50':>14}")
+    for name in ("fp32", "int8"):
+        print(f"[QUANT] {name:6} {report[name]['latency_ms']:9.1f} ms {report[name]['person_map50']:14.4f}")
+    print(f"[QUANT] Speedup {report['fp32']['latency_ms'] / report['int8']['latency_ms']:.2f}x, "
+          f"mAP50 drop {drop:.4f} (limit {max_drop:.4f})")
+
+    if report["published"]:
+        os.replace(candidate, args.output)
+        print(f"[QUANT] Published {args.output}")
+    else:
+        os.remove(candidate)
+        print("[QUANT] INT8 model rejected: accuracy drop exceeds the limit, nothing published")
+
+    with open(REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"[QUANT] Report saved to {REPORT_PATH}")
+    return 0 if report["published"] else 1
+
+
+if __name__ == "__main__":
+    with open("train11/args.yaml", "r") as f:
+        train_args = yaml.safe_load(f)
+
+    parser = argparse.ArgumentParser(description="INT8 quantization of the train11 person detector")
+    parser.add_argument("--weights", default="train11/weights/last.pt")
+    parser.add_argument("--output", default="train11/weights/last_int8.onnx")
+    parser.add_argument("--data", default=train_args["data"], help="Dataset yaml with the validation split")
+    parser.add_argument("--imgsz", type=int, default=train_args["imgsz"])
+    parser.add_argument("--videos", nargs="+", default=["Scene2Cam1_trimmed.mov", "Scene2Cam2_trimmed.mov"])
+    parser.add_argument("--calibration-frames", type=int, default=200)
+    parser.add_argument("--max-drop", type=float, default=None,
+                        help="Largest allowed person mAP50 drop (default int8_max_map50_drop in ai_config.json)")
+    raise SystemExit(main(parser.parse_args()))
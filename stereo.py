@@ -0,0 +1,349 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from assignment import gated_assignment
+
+
+# -------------------------------
+# Stereo Person Matching
+# -------------------------------
+PERSON_CLASS = 0
+MAX_ROW_OFFSET = 40    # Pixels; matching people sit on nearly the same image rows
+MAX_DISPARITY = 250    # Pixels; about 5 ft at the 18 in baseline, closer is out of view anyway
+
+# Uncalibrated distance model (hand-tuned for the 18 in baseline OV5647 pair)
+FOCAL_LENGTH = 700                                     # Focal length in pixels
+BASELINE_IN = 18                                       # Distance between cameras in inches
+DISTANCE_INPUT_POINTS = [10, 15, 20, 25, 30]           # Raw distances
+DISTANCE_SCALE_FACTORS = [0.9901, 1.0791, 1.1429, 1.24, 1.4]
+DISTANCE_OFFSETS = [-0.3, -0.3, -0.4, -0.5, -0.6]
+HORIZONTAL_FOV = 70                                    # Degrees
+LUT_DISPARITY_STEP = 0.05                              # Pixels per distance table entry
+STEREO_WEIGHT = 0.6                                    # Stereo share of the stereo/pixel-height blend
+SCALE_FACTOR = 2.0                                     # Final distance scale
+PIXEL_HEIGHT_CONSTANT = 2000                           # Distance ~ constant / box height
+DISTANCE_CALIBRATION_FILE = "distance_calibration.json"
+ROI_MARGIN_FT = 2.0                                    # World margin around each zone for ROI inference
+
+
+def extract_people(detections, confidence_threshold=0.5):
+    """Return an (N, 5) float32 array [x1, y1, x2, y2, conf] of confident person boxes."""
+    keep = (detections.cls == PERSON_CLASS) & (detections.conf >= confidence_threshold)
+    people = np.empty((int(keep.sum()), 5), dtype=np.float32)
+    people[:, :4] = detections.xyxy[keep]
+    people[:, 4] = detections.conf[keep]
+    return people
+
+
+# Optimal Stereo Assignment
+def match_persons(results1, results2, confidence_threshold=0.5,
+                  max_row_offset=MAX_ROW_OFFSET, max_disparity=MAX_DISPARITY, calibration=None,
+                  disparity_sign=1):
+    """Pair left-camera people with right-camera people by minimum total cost.
+
+    The cost of a pair is center distance plus twice the height difference, computed
+    for all pairs as one matrix and solved as an optimal assignment. Pairs whose centers
+    differ by more than max_row_offset rows (epipolar constraint), or whose disparity
+    is negative or above max_disparity columns, are never matched. disparity_sign is
+    -1 when camera 1 is the right-hand camera. With a calibration the cost and gates use rectified
+    boxes, where the epipolar lines really are rows. Returns two aligned (M, 5) arrays
+    of the original rows, row i of each being the same person.
+    """
+    persons1 = extract_people(results1, confidence_threshold)
+    persons2 = extract_people(results2, confidence_threshold)
+
+    if len(persons1) == 0 or len(persons2) == 0:
+        empty = np.empty((0, 5), dtype=np.float32)
+        return empty, empty
+
+    if calibration is not None:
+        cost, allowed = pairing_cost(calibration.rectify_boxes(persons1, 0), calibration.rectify_boxes(persons2, 1),
+                                     max_row_offset, max_disparity, disparity_sign)
+    else:
+        cost, allowed = pairing_cost(persons1, persons2, max_row_offset, max_disparity, disparity_sign)
+    left_idx, right_idx = gated_assignment(cost, allowed)
+
+    # Report pairs left to right for a stable order between frames
+    order = np.argsort(persons1[left_idx, 0], kind="stable")
+    return persons1[left_idx[order]], persons2[right_idx[order]]
+
+
+def pairing_cost(persons1, persons2, max_row_offset=MAX_ROW_OFFSET, max_disparity=MAX_DISPARITY, disparity_sign=1):
+    """Return the (N, M) matching cost matrix and the mask of geometrically plausible pairs."""
+    x1c = (persons1[:, 0] + persons1[:, 2])[:, None] / 2
+    y1c = (persons1[:, 1] + persons1[:, 3])[:, None] / 2
+    h1 = (persons1[:, 3] - persons1[:, 1])[:, None]
+    x2c = (persons2[:, 0] + persons2[:, 2])[None, :] / 2
+    y2c = (persons2[:, 1] + persons2[:, 3])[None, :] / 2
+    h2 = (persons2[:, 3] - persons2[:, 1])[None, :]
+
+    dx = x1c - x2c
+    dy = y1c - y2c
+    cost = np.hypot(dx, dy) + np.abs(h1 - h2) * 2  # Weight height difference
+    disparity = dx * disparity_sign  # A real left/right pair is never behind the other camera
+    allowed = (np.abs(dy) <= max_row_offset) & (disparity >= 0) & (disparity <= max_disparity)
+    return cost, allowed
+
+
+def box_disparities(rows1, rows2):
+    """Median of left-edge, right-edge and center disparity for aligned (M, 5) rows."""
+    centers1 = (rows1[:, 0] + rows1[:, 2]) / 2
+    centers2 = (rows2[:, 0] + rows2[:, 2]) / 2
+    return np.median(np.abs(np.stack([rows1[:, 0] - rows2[:, 0],
+                                      rows1[:, 2] - rows2[:, 2],
+                                      centers1 - centers2], axis=1)), axis=1)
+
+
+# -------------------------------
+# Uncalibrated Distance and Bearing
+# -------------------------------
+# Distance Calculation Using Bounding Box Centers
+def calculate_distance_from_disparity(disparity, focal_length=FOCAL_LENGTH, baseline_in=BASELINE_IN):
+    """
+    Calculates distance (in feet) from disparity (in pixels) based on an inverse fit.
+    Tuned for 18-inch baseline, Arducam OV5647 stereo cameras.
+    """
+    if disparity <= 0:
+        return None  # Prevent division by zero or negative disparities
+
+    baseline = baseline_in * 0.0254
+    distance = (focal_length*baseline)/disparity
+    scale = np.interp(distance, DISTANCE_INPUT_POINTS, DISTANCE_SCALE_FACTORS)
+    offset = np.interp(distance, DISTANCE_INPUT_POINTS, DISTANCE_OFFSETS)
+    corrected = distance * scale + offset
+    return corrected
+
+
+class DistanceTables:
+    """Dense lookup tables for disparity -> distance and image column -> bearing.
+
+    Built once at startup from the same model as calculate_distance_from_disparity and
+    the FOV-based world conversion, so every detection in a frame is resolved with one
+    NumPy gather instead of np.interp/math.tan calls per person.
+    """
+
+    def __init__(self, frame_width, focal_length=FOCAL_LENGTH, baseline_in=BASELINE_IN,
+                 max_disparity=None, step=LUT_DISPARITY_STEP, fov=HORIZONTAL_FOV, model=None):
+        model = model or default_distance_model()
+        self.step = step
+        max_disparity = max_disparity or frame_width
+        disparity = np.arange(0, max_disparity + 2 * step, step)
+        with np.errstate(divide="ignore"):
+            raw = focal_length * baseline_in * 0.0254 / disparity
+        self.distance = (raw * np.interp(raw, model["input_points"], model["scale_factors"])
+                         + np.interp(raw, model["input_points"], model["offsets"]))
+        self.distance[0] = np.nan  # Zero disparity has no distance
+        self.disparity = disparity
+
+        # tan(bearing) per column, so lateral offset = table value * depth
+        columns = np.arange(frame_width + 1)
+        half = frame_width / 2
+        self.bearing = np.tan(np.radians((columns - half) / half * (fov / 2)))
+        self.half_width = half
+        self.fov = fov
+
+    @staticmethod
+    def _gather(table, index, interpolate):
+        index = np.clip(index, 0, len(table) - 1)
+        if not interpolate:
+            return table[np.rint(index).astype(np.intp)]
+        low = np.minimum(index.astype(np.intp), len(table) - 2)
+        frac = index - low
+        return table[low] * (1 - frac) + table[low + 1] * frac
+
+    def distances(self, disparities, interpolate=True):
+        """Distance in feet for each disparity; NaN where disparity <= 0."""
+        disparities = np.asarray(disparities, dtype=np.float64)
+        result = self._gather(self.distance, disparities / self.step, interpolate)
+        result[disparities <= 0] = np.nan
+        return result
+
+    def bearings(self, columns, interpolate=True):
+        """tan(bearing) for each image column (sub-pixel columns interpolate)."""
+        return self._gather(self.bearing, np.asarray(columns, dtype=np.float64), interpolate)
+
+    def columns(self, bearings):
+        """Image column for each tan(bearing); the inverse of bearings()."""
+        degrees = np.degrees(np.arctan(np.asarray(bearings, dtype=np.float64)))
+        return self.half_width + degrees / (self.fov / 2) * self.half_width
+
+    def disparities(self, distances):
+        """Disparity in pixels that the table maps to each distance; the inverse of distances()."""
+        # Distance falls as disparity grows, so reverse both for np.interp
+        return np.interp(distances, self.distance[:0:-1], self.disparity[:0:-1])
+
+
+def estimate_distances(tables, disparities, heights, stereo_weight=STEREO_WEIGHT):
+    """Uncalibrated distance per person: stereo table lookup blended with the box-height estimate.
+
+    Returns feet before temporal smoothing and the final scale factor; inf where a
+    box has zero height and no usable disparity.
+    """
+    heights = np.asarray(heights, dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        pixel_estimates = PIXEL_HEIGHT_CONSTANT / heights
+    stereo_distances = tables.distances(disparities)
+    stereo_distances = np.where(np.isnan(stereo_distances), pixel_estimates, stereo_distances)
+    distances = stereo_weight * stereo_distances + (1 - stereo_weight) * pixel_estimates
+    return distances * np.where(heights < 100, 0.9, np.where(heights > 250, 1.05, 1.0))
+
+
+def default_distance_model():
+    """The hand-tuned correction parameters, used until fitdistance.py has been run."""
+    return {
+        "version": 0,
+        "input_points": list(DISTANCE_INPUT_POINTS),
+        "scale_factors": list(DISTANCE_SCALE_FACTORS),
+        "offsets": list(DISTANCE_OFFSETS),
+        "stereo_weight": STEREO_WEIGHT,
+        "scale_factor": SCALE_FACTOR,
+    }
+
+
+def load_distance_model(path=DISTANCE_CALIBRATION_FILE):
+    """Load the fitted distance correction, falling back to the hand-tuned defaults."""
+    model = default_distance_model()
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            model.update(json.load(f))
+    return model
+
+
+# -------------------------------
+# Stereo Calibration and Point Rectification
+# -------------------------------
+CALIBRATION_FILE = "stereo_calibration.json"
+CALIBRATION_MATRICES = ("K1", "D1", "K2", "D2", "R", "T", "R1", "R2", "P1", "P2", "Q")
+FEET_PER_UNIT = {"in": 1 / 12, "ft": 1.0, "mm": 1 / 304.8, "cm": 1 / 30.48, "m": 1 / 0.3048}
+
+
+class StereoCalibration:
+    """Stereo intrinsics, extrinsics and rectification written by calibrate.py.
+
+    Only box corner points are undistorted and rectified at runtime, never whole
+    frames, so rectified disparity costs a handful of point transforms per person.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        for name in CALIBRATION_MATRICES:
+            setattr(self, name, np.asarray(data[name], dtype=np.float64))
+        self.image_size = tuple(data["image_size"])
+        self.feet_per_unit = FEET_PER_UNIT[data.get("units", "in")]
+
+    @classmethod
+    def load(cls, path=CALIBRATION_FILE):
+        """Load a calibration file, or return None if there is none."""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def save(self, path=CALIBRATION_FILE):
+        data = dict(self.data)
+        for name in CALIBRATION_MATRICES:
+            data[name] = np.asarray(data[name]).tolist()
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+
+    @property
+    def focal_px(self):
+        """Focal length of the rectified views in pixels."""
+        return float(self.P1[0, 0])
+
+    @property
+    def baseline_in(self):
+        """Distance between the rectified camera centers in inches."""
+        # abs() so a swapped left/right cable does not flip the sign
+        return abs(float(self.P2[0, 3] / self.P2[0, 0])) * self.feet_per_unit * 12
+
+    @property
+    def disparity_sign(self):
+        """+1 when camera 1 is the left camera (P2 translation negative), -1 when swapped."""
+        return 1 if self.P2[0, 3] < 0 else -1
+
+    def rectify_points(self, points, camera):
+        """Undistort and rectify (N, 2) pixel points from camera 0 (left) or 1 (right)."""
+        if len(points) == 0:
+            return np.empty((0, 2), dtype=np.float32)
+        if camera == 0:
+            K, D, R, P = self.K1, self.D1, self.R1, self.P1
+        else:
+            K, D, R, P = self.K2, self.D2, self.R2, self.P2
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.undistortPoints(pts, K, D, R=R, P=P).reshape(-1, 2).astype(np.float32)
+
+    def rectify_boxes(self, boxes, camera):
+        """Return a copy of (N, 5) person rows with both box corners rectified."""
+        rectified = boxes.copy()
+        rectified[:, :4] = self.rectify_points(boxes[:, :4].reshape(-1, 2), camera).reshape(-1, 4)
+        return rectified
+
+
+# -------------------------------
+# Batched Triangulation
+# -------------------------------
+def triangulate_pairs(rectified1, rectified2, calibration):
+    """World (x, y) in feet for every matched pair in one call.
+
+    Takes aligned (M, 5) rows already passed through rectify_boxes and triangulates
+    the box centers with the rectified projection matrices. x is lateral (right of
+    the left camera is positive) and y is depth, matching the zones.json layout.
+    """
+    if len(rectified1) == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    centers1 = np.stack([(rectified1[:, 0] + rectified1[:, 2]) / 2, (rectified1[:, 1] + rectified1[:, 3]) / 2])
+    centers2 = np.stack([(rectified2[:, 0] + rectified2[:, 2]) / 2, (rectified2[:, 1] + rectified2[:, 3]) / 2])
+    homogeneous = cv2.triangulatePoints(calibration.P1, calibration.P2,
+                                        centers1.astype(np.float64), centers2.astype(np.float64))
+    xyz = homogeneous[:3] / homogeneous[3]
+    return np.stack([xyz[0], xyz[2]], axis=1) * calibration.feet_per_unit
+
+
+# -------------------------------
+# Zone Projection for ROI Inference
+# -------------------------------
+def zone_column_spans(zones, frame_width, tables=None, calibration=None,
+                      scale_factor=SCALE_FACTOR, margin_ft=ROI_MARGIN_FT):
+    """Column span (lo, hi) each zone covers in the left and right image.
+
+    The zone's bounding box in world feet, grown by margin_ft, is projected with the
+    rectified projection matrices when calibrated, otherwise with the bearing and
+    disparity tables of the uncalibrated model. Rows are not restricted because the
+    camera height above the yard is not modeled. Returns (left spans, right spans),
+    merged where they overlap and clipped to the frame.
+    """
+    left, right = [], []
+    for polygon in zones.values():
+        polygon = np.asarray(polygon, dtype=np.float64)
+        x_lo, y_lo = polygon.min(axis=0) - margin_ft
+        x_hi, y_hi = polygon.max(axis=0) + margin_ft
+        x = np.array([x_lo, x_hi, x_lo, x_hi])
+        y = np.maximum(np.array([y_lo, y_lo, y_hi, y_hi]), 1.0)  # Nothing to see behind the cameras
+
+        if calibration is not None:
+            x_units, y_units = x / calibration.feet_per_unit, y / calibration.feet_per_unit
+            columns1 = (calibration.P1[0, 0] * x_units + calibration.P1[0, 2] * y_units + calibration.P1[0, 3]) / y_units
+            columns2 = (calibration.P2[0, 0] * x_units + calibration.P2[0, 2] * y_units + calibration.P2[0, 3]) / y_units
+        else:
+            columns1 = tables.columns(x / y)
+            columns2 = columns1 - tables.disparities(y / scale_factor)
+        left.append((columns1.min(), columns1.max()))
+        right.append((columns2.min(), columns2.max()))
+    return merge_spans(left, frame_width), merge_spans(right, frame_width)
+
+
+def merge_spans(spans, frame_width):
+    """Clip column spans to the frame, drop empty ones and merge overlaps."""
+    merged = []
+    for lo, hi in sorted((max(0.0, float(lo)), min(float(frame_width), float(hi))) for lo, hi in spans):
+        if hi <= lo:
+            continue
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged